@@ -0,0 +1,96 @@
+"""Local archives of the blocks received by the indexer.
+
+An archive is a sequence of length-delimited `Block` protobufs: every block is
+prefixed by its size as a varint. Archives ending in `.zst` are compressed with
+zstd, which needs the optional `zstandard` package.
+"""
+
+from apibara.starknet.proto.starknet_pb2 import Block
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def is_compressed(path):
+    return str(path).endswith(".zst")
+
+
+def open_archive(path, mode):
+    """Open the archive at `path` for reading ("rb"), writing ("wb") or appending
+    ("ab")."""
+    if not is_compressed(path):
+        return open(path, mode)
+    if zstandard is None:
+        raise RuntimeError("install the `zstandard` package to use .zst archives")
+    file = open(path, mode)
+    if mode == "rb":
+        # Every (re)start of the recording appends a new zstd frame
+        return zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+    return zstandard.ZstdCompressor().stream_writer(file)
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def read_varint(file):
+    """Read a varint from `file`, `None` at the end of the file."""
+    value = 0
+    shift = 0
+    while True:
+        byte = file.read(1)
+        if not byte:
+            if shift:
+                raise EOFError("truncated block archive")
+            return None
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def read_exactly(file, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = file.read(size - len(data))
+        if not chunk:
+            raise EOFError("truncated block archive")
+        data += chunk
+    return bytes(data)
+
+
+class BlockRecorder:
+    """Append the blocks received by the indexer to an archive."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open_archive(path, "ab")
+
+    def write(self, block: Block):
+        data = block.SerializeToString()
+        self.file.write(encode_varint(len(data)))
+        self.file.write(data)
+        # Keep the archive in step with the indexer cursor stored in MongoDB
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_blocks(path):
+    """Yield the blocks stored in the archive at `path`."""
+    with open_archive(path, "rb") as file:
+        while True:
+            size = read_varint(file)
+            if size is None:
+                return
+            block = Block()
+            block.ParseFromString(read_exactly(file, size))
+            yield block
@@ -0,0 +1,105 @@
+"""In-process caches used by the indexer."""
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Dictionary bounded to `maxsize` entries, evicting the least recently used."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def invalidate(self, predicate):
+        """Drop all the entries whose key matches `predicate`."""
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+
+class ResponseCache:
+    """LRU cache of encoded responses, bounded to `maxbytes` in total.
+
+    Keys start with a namespace (the network), whose generation is bumped on
+    every `invalidate_namespace`. A response computed while its namespace was
+    invalidated must not be stored, see `generation`.
+    """
+
+    def __init__(self, maxbytes: int):
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._generations = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        if key not in self._data:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def set(self, key, value: bytes):
+        if len(value) > self.maxbytes:
+            return
+        self.pop(key)
+        self._data[key] = value
+        self.size += len(value)
+        while self.size > self.maxbytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+    def pop(self, key):
+        value = self._data.pop(key, None)
+        if value is not None:
+            self.size -= len(value)
+        return value
+
+    def invalidate(self, predicate):
+        """Drop all the entries whose key matches `predicate`."""
+        for key in [key for key in self._data if predicate(key)]:
+            self.pop(key)
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def invalidate_namespace(self, namespace):
+        """Drop all the entries of `namespace` and bump its generation."""
+        self._generations[namespace] = self.generation(namespace) + 1
+        self.invalidate(lambda key: key[0] == namespace)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._data),
+            "bytes": self.size,
+        }
@@ -0,0 +1,187 @@
+"""Compact storage schema of the indexer collections.
+
+The legacy schema stores every number as a 32-byte big-endian blob. In the
+compact schema the small integer fields (stats, xp, gold, item and enum ids,
+...) are stored as native Mongo integers instead, felts (ids, addresses,
+hashes, seeds) stay as bytes.
+"""
+
+from pymongo import UpdateOne
+
+LEGACY_STORAGE = 1
+COMPACT_STORAGE = 2
+
+SPECIALS = {"special1", "special2", "special3"}
+
+COMPACT_FIELDS = {
+    "adventurers": {
+        "lastAction",
+        "classType",
+        "homeRealm",
+        "health",
+        "strength",
+        "dexterity",
+        "vitality",
+        "intelligence",
+        "wisdom",
+        "charisma",
+        "xp",
+        "weapon",
+        "chest",
+        "head",
+        "waist",
+        "foot",
+        "hand",
+        "neck",
+        "ring",
+        "beastHealth",
+        "statUpgrades",
+        "gold",
+    },
+    "scores": {"rank", "xp"},
+    "discoveries": {
+        "adventurerHealth",
+        "discoveryType",
+        "subDiscoveryType",
+        "outputAmount",
+        "obstacle",
+        "obstacleLevel",
+        "dodgedObstacle",
+        "damageTaken",
+        "damageLocation",
+        "xpEarnedAdventurer",
+        "xpEarnedItems",
+        "entity",
+        "entityLevel",
+        "entityHealth",
+        "ambushed",
+        *SPECIALS,
+    },
+    "beasts": {"beast", "health", "level", *SPECIALS},
+    "battles": {
+        "adventurerHealth",
+        "beast",
+        "beastHealth",
+        "beastLevel",
+        "attacker",
+        "fled",
+        "damageDealt",
+        "damageTaken",
+        "damageLocation",
+        "xpEarnedAdventurer",
+        "xpEarnedItems",
+        "goldEarned",
+        *SPECIALS,
+    },
+    "items": {"item", "cost", "xp", *SPECIALS},
+    "market_items": {"item", "cost", "xp", *SPECIALS},
+    "health_purchases": {"quantity", "healthAmount"},
+    "deaths": {"death", "killerId"},
+}
+
+
+def compact_value(value):
+    if isinstance(value, bytes):
+        return int.from_bytes(value, "big")
+    if isinstance(value, list):
+        return [compact_value(v) for v in value]
+    return value
+
+
+def expand_value(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value.to_bytes(32, "big")
+    return value
+
+
+def compact_document(collection, doc):
+    """Return `doc` (or a `$set` of its fields) in the compact schema."""
+    fields = COMPACT_FIELDS.get(collection, ())
+    return {
+        key: compact_value(value) if key in fields else value
+        for key, value in doc.items()
+    }
+
+
+def compact_filter(collection, filter):
+    """Return the Mongo `filter` on `collection` in the compact schema."""
+    fields = COMPACT_FIELDS.get(collection, ())
+    compacted = {}
+    for key, value in filter.items():
+        if key in ("$and", "$or", "$nor"):
+            compacted[key] = [compact_filter(collection, f) for f in value]
+        elif key in fields and isinstance(value, dict):
+            compacted[key] = {op: compact_value(v) for op, v in value.items()}
+        elif key in fields:
+            compacted[key] = compact_value(value)
+        else:
+            compacted[key] = value
+    return compacted
+
+
+def compact_update(collection, update):
+    return {
+        operator: compact_document(collection, fields)
+        for operator, fields in update.items()
+    }
+
+
+def get_storage_version(db):
+    """Return the storage schema version of `db`, `None` if it is empty."""
+    state = db["_schema"].find_one({"_id": "storage"})
+    if state is not None:
+        return state["version"]
+    if db["adventurers"].find_one({}, {"_id": 1}) is not None:
+        return LEGACY_STORAGE
+    return None
+
+
+def set_storage_version(db, version):
+    db["_schema"].update_one(
+        {"_id": "storage"}, {"$set": {"version": version}}, upsert=True
+    )
+
+
+def check_storage_version(db, compact):
+    """Record the storage schema of a new database, or make sure the schema of
+    an existing one is the requested one."""
+    wanted = COMPACT_STORAGE if compact else LEGACY_STORAGE
+    version = get_storage_version(db)
+    if version is None:
+        set_storage_version(db, wanted)
+    elif version != wanted:
+        raise ValueError(
+            f"storage schema is version {version}, expected {wanted}."
+            " Run `indexer migrate-storage` first."
+        )
+
+
+def migrate_storage(db, compact, batch_size=1000):
+    """Rewrite all documents of `db`, including the old versions, to the
+    compact (or back to the legacy) schema. Returns the number of updated
+    documents."""
+    convert = compact_value if compact else expand_value
+    # Only touch the documents still in the other schema, so the migration
+    # can be resumed if interrupted.
+    source_type = "binData" if compact else "number"
+    updated = 0
+    for collection, fields in COMPACT_FIELDS.items():
+        cursor = db[collection].find(
+            {"$or": [{field: {"$type": source_type}} for field in fields]},
+            {field: 1 for field in fields},
+        )
+        requests = []
+        for doc in cursor:
+            update = {
+                field: convert(doc[field])
+                for field in fields
+                if doc.get(field) is not None
+            }
+            requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+            if len(requests) == batch_size:
+                updated += db[collection].bulk_write(requests).modified_count
+                requests = []
+        if requests:
+            updated += db[collection].bulk_write(requests).modified_count
+    set_storage_version(db, COMPACT_STORAGE if compact else LEGACY_STORAGE)
+    return updated
@@ -1,5 +1,13 @@
 class Config:
-    def __init__(self, network=None, game=None, start_block=None):
+    def __init__(
+        self,
+        network=None,
+        game=None,
+        start_block=None,
+        compact_storage=False,
+        handler_concurrency=16,
+        journal=False,
+    ):
         self.network = network
         self.GAME_CONTRACT = game
         if start_block:
@@ -7,6 +15,18 @@ class Config:
         else:
             self.STARTING_BLOCK = start_block
 
+        self.ADVENTURER_CACHE_SIZE = 10_000
+        self.DISCOVERY_CACHE_SIZE = 10_000
+        # Replaced market offers are deleted this many blocks after being
+        # replaced, once no reorganization can bring them back
+        self.MARKET_HISTORY_BLOCKS = 1_000
+        # Store small integers as native ints, see `indexer.compact`
+        self.COMPACT_STORAGE = compact_storage
+        # Adventurers whose events of a block are handled concurrently
+        self.HANDLER_CONCURRENCY = handler_concurrency
+        # Write the raw events to the journal, see `indexer.journal`
+        self.JOURNAL = journal
+
         self.BEASTS = {
             1: "Warlock",
             2: "Typhon",
@@ -1,5 +1,15 @@
+from collections import namedtuple
+
 from starknet_py.abi.v1.parser import AbiParser
-from starknet_py.serialization import serializer_for_payload
+from starknet_py.cairo.data_types import (
+    ArrayType,
+    BoolType,
+    EnumType,
+    FeltType,
+    StructType,
+    UintType,
+    UnitType,
+)
 
 
 from typing import Iterator
@@ -609,128 +619,348 @@ raw_abi = [
     },
 ]
 
+
+class EventRecord:
+    """Decoded event, with one slot per event member.
+
+    Struct members are decoded as dicts, like starknet_py does.
+    """
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        members = ", ".join(
+            f"{name}={value!r}" for name, value in self.as_dict().items()
+        )
+        return f"{type(self).__name__}({members})"
+
+    def as_dict(self):
+        return dict(zip(self.__slots__, self))
+
+
+EnumVariant = namedtuple("EnumVariant", ["variant", "value"])
+
+
+class EventDecoder:
+    """Decoder of one event, generated from its ABI by `compile_event_decoder`.
+
+    `deserialize` takes the event data as ints, like starknet_py serializers.
+    `deserialize_felts` and `deserialize_many` take the wire `FieldElement`s
+    and skip the conversion of the high limbs of small integers.
+    """
+
+    def __init__(
+        self, record, deserialize, deserialize_felts, deserialize_many, source
+    ):
+        self.record = record
+        self.deserialize = deserialize
+        self.deserialize_felts = deserialize_felts
+        self.deserialize_many = deserialize_many
+        self.source = source
+
+
+def _read_int(offset, bits):
+    return f"data[i + {offset}]"
+
+
+def _read_felt(offset, bits):
+    # Field elements are sent as four big-endian 64 bits limbs
+    felt = f"data[i + {offset}]"
+    if bits is not None and bits <= 64:
+        return f"{felt}.hi_hi"
+    if bits is not None and bits <= 128:
+        return f"(({felt}.hi_lo << 64) + {felt}.hi_hi)"
+    return (
+        f"(({felt}.lo_lo << 192) + ({felt}.lo_hi << 128)"
+        f" + ({felt}.hi_lo << 64) + {felt}.hi_hi)"
+    )
+
+
+def _compile_type(cairo_type, offset, read, env):
+    """Return the expression decoding `cairo_type` from `data[i + offset]`, and
+    the number of felts it spans."""
+    if isinstance(cairo_type, FeltType):
+        return read(offset, None), 1
+    if isinstance(cairo_type, UintType) and cairo_type.bits <= 128:
+        return read(offset, cairo_type.bits), 1
+    if isinstance(cairo_type, UintType) and cairo_type.bits == 256:
+        return f"({read(offset, 128)} + ({read(offset + 1, 128)} << 128))", 2
+    if isinstance(cairo_type, BoolType):
+        return f"({read(offset, 8)} != 0)", 1
+    if isinstance(cairo_type, StructType):
+        members = []
+        size = 0
+        for name, member_type in cairo_type.types.items():
+            expr, member_size = _compile_type(member_type, offset + size, read, env)
+            members.append(f"{name!r}: {expr}")
+            size += member_size
+        return "{" + ", ".join(members) + "}", size
+    if isinstance(cairo_type, EnumType) and all(
+        isinstance(t, UnitType) for t in cairo_type.variants.values()
+    ):
+        variants = f"_variants_{len(env)}"
+        env[variants] = tuple(EnumVariant(name, None) for name in cairo_type.variants)
+        return f"{variants}[{read(offset, 8)}]", 1
+    raise NotImplementedError(f"cannot compile decoder for {cairo_type}")
+
+
+def _compile_body(event, read, env):
+    """Return the lines decoding the inputs of `event` from `data` into local
+    variables of the same names."""
+    body = ["i = 0"]
+    offset = 0
+    for name, cairo_type in event.inputs.items():
+        if isinstance(cairo_type, ArrayType):
+            expr, size = _compile_type(cairo_type.inner_type, 0, read, env)
+            body += [
+                f"n = {read(offset, 32)}",
+                f"i += {offset + 1}",
+                f"{name} = []",
+                "for _ in range(n):",
+                f"    {name}.append({expr})",
+                f"    i += {size}",
+            ]
+            offset = 0
+        else:
+            expr, size = _compile_type(cairo_type, offset, read, env)
+            body.append(f"{name} = {expr}")
+            offset += size
+    return body
+
+
+def compile_event_decoder(event) -> EventDecoder:
+    """Generate the decoder of `event` from its ABI.
+
+    Members have a fixed felt layout, so every field is read at a constant
+    offset into the data. Arrays are only supported at the top level and move
+    the base offset of the members after them. `deserialize_many` inlines the
+    felts decoder in a loop over the rows.
+    """
+    record_name = event.name.split("::")[-1]
+    names = list(event.inputs)
+    record = f"{record_name}({', '.join(names)})"
+    env = {}
+    int_body = _compile_body(event, _read_int, env)
+    felt_body = _compile_body(event, _read_felt, env)
+    source = "\n".join(
+        [
+            f"class {record_name}(EventRecord):",
+            f"    __slots__ = {tuple(names)!r}",
+            "",
+            f"    def __init__(self, {', '.join(names)}):",
+            *[f"        self.{name} = {name}" for name in names],
+            "",
+            "",
+            "def deserialize(data):",
+            *[f"    {line}" for line in int_body],
+            f"    return {record}",
+            "",
+            "",
+            "def deserialize_felts(data):",
+            *[f"    {line}" for line in felt_body],
+            f"    return {record}",
+            "",
+            "",
+            "def deserialize_many(rows):",
+            "    records = []",
+            "    append = records.append",
+            "    for data in rows:",
+            *[f"        {line}" for line in felt_body],
+            f"        append({record})",
+            "    return records",
+        ]
+    )
+    namespace = {"EventRecord": EventRecord, **env}
+    exec(compile(source, f"<{event.name} decoder>", "exec"), namespace)
+    return EventDecoder(
+        namespace[record_name],
+        namespace["deserialize"],
+        namespace["deserialize_felts"],
+        namespace["deserialize_many"],
+        source,
+    )
+
+
 game_contract_abi = AbiParser(raw_abi).parse()
 
-decode_start_game_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::StartGame"].inputs
+decode_start_game_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::StartGame"]
 )
 
-decode_stat_upgrades_available_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::StatUpgradesAvailable"].inputs
+decode_stat_upgrades_available_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::StatUpgradesAvailable"]
 )
 
-decode_strength_increased_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::StrengthIncreased"].inputs
+decode_strength_increased_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::StrengthIncreased"]
 )
 
-decode_dexterity_increased_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::DexterityIncreased"].inputs
+decode_dexterity_increased_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::DexterityIncreased"]
 )
 
-decode_vitality_increased_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::VitalityIncreased"].inputs
+decode_vitality_increased_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::VitalityIncreased"]
 )
 
-decode_intelligence_increased_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::IntelligenceIncreased"].inputs
+decode_intelligence_increased_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::IntelligenceIncreased"]
 )
 
-decode_wisdom_increased_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::WisdomIncreased"].inputs
+decode_wisdom_increased_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::WisdomIncreased"]
 )
 
-decode_charisma_increased_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::CharismaIncreased"].inputs
+decode_charisma_increased_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::CharismaIncreased"]
 )
 
-decode_discover_health_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::DiscoveredHealth"].inputs
+decode_discover_health_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::DiscoveredHealth"]
 )
 
-decode_discover_gold_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::DiscoveredGold"].inputs
+decode_discover_gold_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::DiscoveredGold"]
 )
 
-decode_discover_xp_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::DiscoveredXP"].inputs
+decode_discover_xp_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::DiscoveredXP"]
 )
 
-decode_dodged_obstacle_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::DodgedObstacle"].inputs
+decode_dodged_obstacle_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::DodgedObstacle"]
 )
 
-decode_hit_by_obstacle_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::HitByObstacle"].inputs
+decode_hit_by_obstacle_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::HitByObstacle"]
 )
 
-decode_ambushed_by_beast_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::AmbushedByBeast"].inputs
+decode_ambushed_by_beast_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::AmbushedByBeast"]
 )
 
-decode_discover_beast_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::DiscoveredBeast"].inputs
+decode_discover_beast_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::DiscoveredBeast"]
 )
 
-decode_attack_beast_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::AttackedBeast"].inputs
+decode_attack_beast_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::AttackedBeast"]
 )
 
-decode_attacked_by_beast_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::AttackedByBeast"].inputs
+decode_attacked_by_beast_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::AttackedByBeast"]
 )
 
-decode_slayed_beast_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::SlayedBeast"].inputs
+decode_slayed_beast_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::SlayedBeast"]
 )
 
-decode_flee_failed_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::FleeFailed"].inputs
+decode_flee_failed_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::FleeFailed"]
 )
 
-decode_flee_succeeded_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::FleeSucceeded"].inputs
+decode_flee_succeeded_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::FleeSucceeded"]
 )
 
-decode_purchased_item_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::PurchasedItem"].inputs
+decode_purchased_item_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::PurchasedItem"]
 )
 
-decode_equipped_item_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::EquippedItem"].inputs
+decode_equipped_item_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::EquippedItem"]
 )
 
-decode_dropped_item_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::DroppedItem"].inputs
+decode_dropped_item_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::DroppedItem"]
 )
 
-decode_greatness_increased_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::GreatnessIncreased"].inputs
+decode_greatness_increased_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::GreatnessIncreased"]
 )
 
-decode_item_special_unlocked_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::ItemSpecialUnlocked"].inputs
+decode_item_special_unlocked_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::ItemSpecialUnlocked"]
 )
 
-decode_purchased_potion_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::PurchasedPotion"].inputs
+decode_purchased_potion_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::PurchasedPotion"]
 )
 
-decode_new_high_score_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::NewHighScore"].inputs
+decode_new_high_score_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::NewHighScore"]
 )
 
-decode_adventurer_died_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::AdventurerDied"].inputs
+decode_adventurer_died_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::AdventurerDied"]
 )
 
-decode_adventurer_leveled_up_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::AdventurerLeveledUp"].inputs
+decode_adventurer_leveled_up_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::AdventurerLeveledUp"]
 )
 
-decode_new_items_available_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::NewItemsAvailable"].inputs
+decode_new_items_available_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::NewItemsAvailable"]
 )
 
-decode_idle_damage_penalty_event = serializer_for_payload(
-    game_contract_abi.events["game::Game::IdleDamagePenalty"].inputs
+decode_idle_damage_penalty_event = compile_event_decoder(
+    game_contract_abi.events["game::Game::IdleDamagePenalty"]
 )
+
+event_decoders = {
+    "StartGame": decode_start_game_event,
+    "StatUpgradesAvailable": decode_stat_upgrades_available_event,
+    "StrengthIncreased": decode_strength_increased_event,
+    "DexterityIncreased": decode_dexterity_increased_event,
+    "VitalityIncreased": decode_vitality_increased_event,
+    "IntelligenceIncreased": decode_intelligence_increased_event,
+    "WisdomIncreased": decode_wisdom_increased_event,
+    "CharismaIncreased": decode_charisma_increased_event,
+    "DiscoveredHealth": decode_discover_health_event,
+    "DiscoveredGold": decode_discover_gold_event,
+    "DiscoveredXP": decode_discover_xp_event,
+    "DodgedObstacle": decode_dodged_obstacle_event,
+    "HitByObstacle": decode_hit_by_obstacle_event,
+    "AmbushedByBeast": decode_ambushed_by_beast_event,
+    "DiscoveredBeast": decode_discover_beast_event,
+    "AttackedBeast": decode_attack_beast_event,
+    "AttackedByBeast": decode_attacked_by_beast_event,
+    "SlayedBeast": decode_slayed_beast_event,
+    "FleeFailed": decode_flee_failed_event,
+    "FleeSucceeded": decode_flee_succeeded_event,
+    "PurchasedItem": decode_purchased_item_event,
+    "EquippedItem": decode_equipped_item_event,
+    "DroppedItem": decode_dropped_item_event,
+    "GreatnessIncreased": decode_greatness_increased_event,
+    "ItemSpecialUnlocked": decode_item_special_unlocked_event,
+    "PurchasedPotion": decode_purchased_potion_event,
+    "NewHighScore": decode_new_high_score_event,
+    "AdventurerDied": decode_adventurer_died_event,
+    "AdventurerLeveledUp": decode_adventurer_leveled_up_event,
+    "NewItemsAvailable": decode_new_items_available_event,
+    "IdleDamagePenalty": decode_idle_damage_penalty_event,
+}
+
+
+def decode_events(event_names, events):
+    """Decode the data of `events`, grouped by their name in `event_names`.
+
+    Returns the decoded records in the order of `events`.
+    """
+    groups = {}
+    for index, name in enumerate(event_names):
+        groups.setdefault(name, []).append(index)
+    decoded = [None] * len(events)
+    for name, indexes in groups.items():
+        records = event_decoders[name].deserialize_many(
+            [events[index].data for index in indexes]
+        )
+        for index, record in zip(indexes, records):
+            decoded[index] = record
+    return decoded
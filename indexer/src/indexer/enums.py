@@ -0,0 +1,70 @@
+"""Lookup tables of the game enums defined in `Config`.
+
+Built once at import and shared by the indexer and the GraphQL API, so mapping
+between felts, their 32-byte Mongo encoding and their names is a dict lookup.
+"""
+
+from indexer.config import Config
+
+
+class Enum:
+    """Two-way mapping between the felts of an enum and their names."""
+
+    def __init__(self, names):
+        self.names = dict(names)
+        self.felts = {}
+        for felt, name in names.items():
+            # Same as `get_key_by_value`, the first felt of a name wins
+            self.felts.setdefault(name, felt)
+        self.encoded = {name: encode_felt(felt) for name, felt in self.felts.items()}
+        self.decoded = {encode_felt(felt): name for felt, name in names.items()}
+
+    def felt(self, name):
+        return self.felts.get(name)
+
+    def name(self, felt):
+        return self.names.get(felt)
+
+    def encode(self, name) -> bytes:
+        """Return the Mongo encoding of the felt named `name`."""
+        try:
+            return self.encoded[name]
+        except KeyError:
+            raise ValueError(f"invalid value {name}")
+
+    def decode(self, value: bytes):
+        """Return the name of the felt encoded in `value`."""
+        # Compact storage keeps enums as ints
+        if isinstance(value, int):
+            return self.names.get(value)
+        name = self.decoded.get(value)
+        if name is None and len(value) != 32:
+            return self.names.get(int.from_bytes(value, "big"))
+        return name
+
+
+_config = Config()
+
+# Encoding of the felts below 256, covers the values of all the enums
+ENCODED_FELTS = [felt.to_bytes(32, "big") for felt in range(256)]
+
+
+def encode_felt(felt: int) -> bytes:
+    if 0 <= felt < 256:
+        return ENCODED_FELTS[felt]
+    return felt.to_bytes(32, "big")
+
+
+BEASTS = Enum(_config.BEASTS)
+ITEMS = Enum(_config.ITEMS)
+CLASSES = Enum(_config.CLASSES)
+OBSTACLES = Enum(_config.OBSTACLES)
+ADVENTURER_STATUS = Enum(_config.ADVENTURER_STATUS)
+DISCOVERY_TYPES = Enum(_config.DISCOVERY_TYPES)
+SUB_DISCOVERY_TYPES = Enum(_config.SUB_DISCOVERY_TYPES)
+MATERIALS = Enum(_config.MATERIALS)
+ITEM_NAME_PREFIXES = Enum(_config.ITEM_NAME_PREFIXES)
+ITEM_NAME_SUFFIXES = Enum(_config.ITEM_NAME_SUFFIXES)
+ITEM_SUFFIXES = Enum(_config.ITEM_SUFFIXES)
+SLOTS = Enum(_config.SLOTS)
+ATTACKERS = Enum(_config.ATTACKERS)
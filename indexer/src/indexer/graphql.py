@@ -1,20 +1,44 @@
 import asyncio
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, NewType, Optional, Dict
+from functools import partial
+from typing import Generic, List, NewType, Optional, Dict, TypeVar
 import socket
 import ssl
 
 import strawberry
 import aiohttp_cors
+import bson
 from aiohttp import web
+from graphql import GraphQLError, parse, print_ast
 from pymongo import MongoClient
+from strawberry.aiohttp.handlers import HTTPHandler
+from strawberry.exceptions import MissingQueryError
+from strawberry.schema.exceptions import InvalidOperationTypeError
+from strawberry.types.graphql import OperationType
+from strawberry.utils.operation import get_operation_type
 from strawberry.aiohttp.views import GraphQLView
+from strawberry.dataloader import DataLoader
 from indexer.indexer import LootSurvivorIndexer
 from indexer.utils import felt_to_str, str_to_felt, get_key_by_value
 from indexer.config import Config
+from indexer import enums
+from indexer.indexes import ensure_indexes
+from indexer.cache import ResponseCache
+from indexer.compact import COMPACT_STORAGE, compact_filter, get_storage_version
+from indexer.log import IndexerLogger, configure_logging
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
 
 config = Config()
 
+logger = IndexerLogger(__name__)
+
 
 def parse_hex(value):
     if not value.startswith("0x"):
@@ -31,6 +55,9 @@ def parse_felt(value):
 
 
 def serialize_felt(value):
+    # Compact storage keeps small numbers as ints
+    if isinstance(value, int):
+        return value
     return int.from_bytes(value, "big")
 
 
@@ -43,93 +70,75 @@ def serialize_string(value):
 
 
 def parse_class(value):
-    felt = get_key_by_value(value, config.CLASSES)
-    return felt.to_bytes(32, "big")
+    return enums.CLASSES.encode(value)
 
 
 def serialize_class(value):
-    felt = int.from_bytes(value, "big")
-    return config.CLASSES.get(felt)
+    return enums.CLASSES.decode(value)
 
 
 def parse_beast(value):
-    felt = get_key_by_value(value, config.BEASTS)
-    return felt.to_bytes(32, "big")
+    return enums.BEASTS.encode(value)
 
 
 def serialize_beast(value):
-    felt = int.from_bytes(value, "big")
-    return config.BEASTS.get(felt)
+    return enums.BEASTS.decode(value)
 
 
 def parse_adventurer_status(value):
-    felt = get_key_by_value(value, config.ADVENTURER_STATUS)
-    return felt.to_bytes(32, "big")
+    return enums.ADVENTURER_STATUS.encode(value)
 
 
 def serialize_adventurer_status(value):
-    felt = int.from_bytes(value, "big")
-    return config.ADVENTURER_STATUS.get(felt)
+    return enums.ADVENTURER_STATUS.decode(value)
 
 
 def parse_discovery(value):
-    felt = get_key_by_value(value, config.DISCOVERY_TYPES)
-    return felt.to_bytes(32, "big")
+    return enums.DISCOVERY_TYPES.encode(value)
 
 
 def serialize_discovery(value):
-    felt = int.from_bytes(value, "big")
-    return config.DISCOVERY_TYPES.get(felt)
+    return enums.DISCOVERY_TYPES.decode(value)
 
 
 def parse_sub_discovery(value):
-    felt = get_key_by_value(value, config.SUB_DISCOVERY_TYPES)
-    return felt.to_bytes(32, "big")
+    return enums.SUB_DISCOVERY_TYPES.encode(value)
 
 
 def serialize_sub_discovery(value):
-    felt = int.from_bytes(value, "big")
-    return config.SUB_DISCOVERY_TYPES.get(felt)
+    return enums.SUB_DISCOVERY_TYPES.decode(value)
 
 
 def parse_obstacle(value):
-    felt = get_key_by_value(value, config.OBSTACLES)
-    return felt.to_bytes(32, "big")
+    return enums.OBSTACLES.encode(value)
 
 
 def serialize_obstacle(value):
-    felt = int.from_bytes(value, "big")
-    return config.OBSTACLES.get(felt)
+    return enums.OBSTACLES.decode(value)
 
 
 def parse_attacker(value):
-    felt = get_key_by_value(value, config.ATTACKERS)
-    return felt.to_bytes(32, "big")
+    return enums.ATTACKERS.encode(value)
 
 
 def serialize_attacker(value):
-    felt = int.from_bytes(value, "big")
-    return config.ATTACKERS.get(felt)
+    return enums.ATTACKERS.decode(value)
 
 
 def parse_item(value):
-    felt = get_key_by_value(value, config.ITEMS)
-    return felt.to_bytes(32, "big")
+    return enums.ITEMS.encode(value)
 
 
 def serialize_item(value):
-    felt = int.from_bytes(value, "big")
-    return config.ITEMS.get(felt)
+    return enums.ITEMS.decode(value)
 
 
 def parse_material(value):
-    felt = get_key_by_value(value, config.MATERIALS)
-    return felt.to_bytes(32, "big")
+    return enums.MATERIALS.encode(value)
 
 
 def serialize_material(value):
-    felt = int.from_bytes(value, "big")
-    return config.MATERIALS.get(felt)
+    return enums.MATERIALS.decode(value)
 
 
 def parse_item_type(value):
@@ -143,36 +152,27 @@ def serialize_item_type(value):
 
 
 def parse_special_2(value):
-    felt = get_key_by_value(value, config.ITEM_NAME_PREFIXES)
-    return felt.to_bytes(32, "big")
+    return enums.ITEM_NAME_PREFIXES.encode(value)
 
 
 def serialize_special_2(value):
-    felt = int.from_bytes(value, "big")
-    if felt == 0:
-        return None
-    else:
-        return config.ITEM_NAME_PREFIXES.get(felt)
+    return enums.ITEM_NAME_PREFIXES.decode(value)
 
 
 def parse_special_3(value):
-    felt = get_key_by_value(value, config.ITEM_NAME_SUFFIXES)
-    return felt.to_bytes(32, "big")
+    return enums.ITEM_NAME_SUFFIXES.encode(value)
 
 
 def serialize_special_3(value):
-    felt = int.from_bytes(value, "big")
-    return config.ITEM_NAME_SUFFIXES.get(felt)
+    return enums.ITEM_NAME_SUFFIXES.decode(value)
 
 
 def parse_special_1(value):
-    felt = get_key_by_value(value, config.ITEM_SUFFIXES)
-    return felt.to_bytes(32, "big")
+    return enums.ITEM_SUFFIXES.encode(value)
 
 
 def serialize_special_1(value):
-    felt = int.from_bytes(value, "big")
-    return config.ITEM_SUFFIXES.get(felt)
+    return enums.ITEM_SUFFIXES.decode(value)
 
 
 def parse_item_status(value):
@@ -186,23 +186,19 @@ def serialize_item_status(value):
 
 
 def parse_slot(value):
-    felt = get_key_by_value(value, config.SLOTS)
-    return felt.to_bytes(32, "big")
+    return enums.SLOTS.encode(value)
 
 
 def serialize_slot(value):
-    felt = int.from_bytes(value, "big")
-    return config.SLOTS.get(felt)
+    return enums.SLOTS.decode(value)
 
 
 def parse_adventurer(value):
-    felt = get_key_by_value(value, config.ATTACKERS)
-    return felt.to_bytes(32, "big")
+    return enums.ATTACKERS.encode(value)
 
 
 def serialize_adventurer(value):
-    felt = int.from_bytes(value, "big")
-    return config.ATTACKERS.get(felt)
+    return enums.ATTACKERS.decode(value)
 
 
 HexValue = strawberry.scalar(
@@ -733,6 +729,7 @@ class AdventurersOrderByInput:
     createdTime: Optional[OrderByInput] = None
     lastUpdatedTime: Optional[OrderByInput] = None
     timestamp: Optional[OrderByInput] = None
+    position: Optional[OrderByInput] = None
 
 
 @strawberry.input
@@ -744,6 +741,7 @@ class ScoresOrderByInput:
     txHash: Optional[OrderByInput] = None
     scoreTime: Optional[OrderByInput] = None
     timestamp: Optional[OrderByInput] = None
+    position: Optional[OrderByInput] = None
 
 
 @strawberry.input
@@ -771,6 +769,7 @@ class DiscoveriesOrderByInput:
     timestamp: Optional[OrderByInput] = None
     seed: Optional[OrderByInput] = None
     txHash: Optional[OrderByInput] = None
+    position: Optional[OrderByInput] = None
 
 
 @strawberry.input
@@ -787,6 +786,7 @@ class BeastsOrderByInput:
     createdTime: Optional[OrderByInput] = None
     lastUpdatedTime: Optional[OrderByInput] = None
     timestamp: Optional[OrderByInput] = None
+    position: Optional[OrderByInput] = None
 
 
 @strawberry.input
@@ -813,6 +813,7 @@ class BattlesOrderByInput:
     discoveryTime: Optional[OrderByInput] = None
     blockTime: Optional[OrderByInput] = None
     timestamp: Optional[OrderByInput] = None
+    position: Optional[OrderByInput] = None
 
 
 @strawberry.input
@@ -831,6 +832,7 @@ class ItemsOrderByInput:
     xp: Optional[OrderByInput] = None
     lastUpdatedTime: Optional[OrderByInput] = None
     timestamp: Optional[OrderByInput] = None
+    position: Optional[OrderByInput] = None
 
 
 @strawberry.type
@@ -897,6 +899,14 @@ class Adventurer:
             timestamp=data["timestamp"],
         )
 
+    @strawberry.field
+    async def items(self, info) -> List["Item"]:
+        return await info.context["loaders"]["items"].load(self.id)
+
+    @strawberry.field
+    async def battles(self, info) -> List["Battle"]:
+        return await info.context["loaders"]["battles"].load(self.id)
+
 
 @strawberry.type
 class Score:
@@ -920,6 +930,10 @@ class Score:
             timestamp=data["timestamp"],
         )
 
+    @strawberry.field
+    async def adventurer(self, info) -> Optional[Adventurer]:
+        return await info.context["loaders"]["adventurers"].load(self.adventurerId)
+
 
 @strawberry.type
 class Discovery:
@@ -1061,6 +1075,13 @@ class Battle:
             timestamp=data["timestamp"],
         )
 
+    # `beast` already holds the beast name
+    @strawberry.field
+    async def beastDetails(self, info) -> Optional[Beast]:
+        return await info.context["loaders"]["beasts"].load(
+            (self.beast, self.adventurerId, self.seed)
+        )
+
 
 @strawberry.type
 class Item:
@@ -1099,6 +1120,29 @@ class Item:
         )
 
 
+T = TypeVar("T")
+
+
+@strawberry.type
+class PageInfo:
+    hasNextPage: bool
+    hasPreviousPage: bool
+    startCursor: Optional[str]
+    endCursor: Optional[str]
+
+
+@strawberry.type
+class Edge(Generic[T]):
+    node: T
+    cursor: str
+
+
+@strawberry.type
+class Connection(Generic[T]):
+    edges: List[Edge[T]]
+    pageInfo: PageInfo
+
+
 def get_str_filters(where: StringFilter) -> List[Dict]:
     filter = {}
     if where.eq:
@@ -1201,15 +1245,192 @@ def process_filters(obj, prefix=None):
     return filters
 
 
-def get_adventurers(
-    info,
-    where: Optional[AdventurersFilter] = {},
-    limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[AdventurersOrderByInput] = {},
-) -> List[Adventurer]:
+def get_sort(orderBy):
+    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
+
+    # Latest first in chain order, see `indexer.writer.chain_position`
+    sort_var = "position"
+    sort_dir = -1
+
+    for key, value in sort_options.items():
+        if value.asc:
+            sort_var = key
+            sort_dir = 1
+            break
+        if value.desc:
+            sort_var = key
+            sort_dir = -1
+            break
+
+    return sort_var, sort_dir
+
+
+async def fetch_documents(context, cursor):
+    executor = context["executor"]
+
+    # Blocking driver, iterate the cursor away from the event loop
+    if executor is not None:
+        return await asyncio.get_running_loop().run_in_executor(executor, list, cursor)
+
+    return await cursor.to_list(length=None)
+
+
+async def find_documents(info, collection, filter, skip, limit, sort_var, sort_dir):
     db = info.context["db"]
+    if info.context["compact"]:
+        filter = compact_filter(collection, filter)
+    cursor = (
+        db[collection]
+        .find(filter)
+        .skip(skip)
+        .limit(limit)
+        .sort([(sort_var, sort_dir), ("_id", sort_dir)])
+    )
+    return await fetch_documents(info.context, cursor)
+
 
+def group_documents(docs, key, keys, from_mongo):
+    groups = {k: [] for k in keys}
+    for doc in docs:
+        groups[doc[key]].append(from_mongo(doc))
+    return [groups[k] for k in keys]
+
+
+async def load_adventurers(context, ids):
+    cursor = context["db"]["adventurers"].find(
+        {"_chain.valid_to": None, "id": {"$in": ids}}
+    )
+    docs = await fetch_documents(context, cursor)
+    adventurers = {doc["id"]: Adventurer.from_mongo(doc) for doc in docs}
+    return [adventurers.get(id) for id in ids]
+
+
+async def load_items(context, adventurer_ids):
+    cursor = (
+        context["db"]["items"]
+        .find(
+            {
+                "_chain.valid_to": None,
+                "adventurerId": {"$in": adventurer_ids},
+                "owner": True,
+            }
+        )
+        .sort([("position", 1), ("_id", 1)])
+    )
+    docs = await fetch_documents(context, cursor)
+    return group_documents(docs, "adventurerId", adventurer_ids, Item.from_mongo)
+
+
+async def load_battles(context, adventurer_ids):
+    cursor = (
+        context["db"]["battles"]
+        .find({"_chain.valid_to": None, "adventurerId": {"$in": adventurer_ids}})
+        .sort([("position", 1), ("_id", 1)])
+    )
+    docs = await fetch_documents(context, cursor)
+    return group_documents(docs, "adventurerId", adventurer_ids, Battle.from_mongo)
+
+
+async def load_beasts(context, keys):
+    adventurer_ids = list({adventurer_id for _, adventurer_id, _ in keys})
+    cursor = context["db"]["beasts"].find(
+        {"_chain.valid_to": None, "adventurerId": {"$in": adventurer_ids}}
+    )
+    docs = await fetch_documents(context, cursor)
+    beasts = {
+        (doc["beast"], doc["adventurerId"], doc["seed"]): Beast.from_mongo(doc)
+        for doc in docs
+    }
+    return [beasts.get(key) for key in keys]
+
+
+def get_loaders(context):
+    """Per-request loaders of the relation fields, each batching the lookups of
+    one resolver pass into a single `$in` query."""
+    return {
+        "adventurers": DataLoader(partial(load_adventurers, context)),
+        "items": DataLoader(partial(load_items, context)),
+        "battles": DataLoader(partial(load_battles, context)),
+        "beasts": DataLoader(partial(load_beasts, context)),
+    }
+
+
+def encode_cursor(doc, sort_var):
+    data = bson.encode({"value": doc.get(sort_var), "id": doc["_id"]})
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        data = bson.decode(base64.urlsafe_b64decode(cursor.encode()))
+        return data["value"], data["id"]
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def get_keyset_filter(sort_var, sort_dir, value, id):
+    """Filter the documents that come after `(value, id)` when sorting on
+    `(sort_var, _id)` in `sort_dir`. Mongo sorts nulls first.
+
+    The range on `sort_var` bounds the scan of the sort index, so a page starts
+    with a seek, and the `$or` only breaks the ties on `value`.
+    """
+    op = "$gt" if sort_dir == 1 else "$lt"
+    if value is None:
+        if sort_dir == 1:
+            return {"$or": [{sort_var: {"$ne": None}}, {"_id": {op: id}}]}
+        return {sort_var: None, "_id": {op: id}}
+    if sort_dir == 1:
+        bound = {"$gte": value}
+    else:
+        # Also matches the nulls, that come last
+        bound = {"$not": {"$gt": value}}
+    return {sort_var: bound, "$or": [{sort_var: {"$ne": value}}, {"_id": {op: id}}]}
+
+
+async def find_connection(
+    info, collection, from_mongo, filter, sort, first, after, last, before
+):
+    sort_var, sort_dir = sort
+    if info.context["compact"]:
+        filter = compact_filter(collection, filter)
+    backward = last is not None or before is not None
+    limit = (last if backward else first) or 10
+    cursor = before if backward else after
+    if backward:
+        # Walk the sort backwards from `before`, then restore the page order
+        sort_dir = -sort_dir
+
+    if cursor is not None:
+        value, id = decode_cursor(cursor)
+        filter = {"$and": [filter, get_keyset_filter(sort_var, sort_dir, value, id)]}
+
+    db = info.context["db"]
+    query = await fetch_documents(
+        info.context,
+        db[collection]
+        .find(filter)
+        .limit(limit + 1)
+        .sort([(sort_var, sort_dir), ("_id", sort_dir)]),
+    )
+    has_more = len(query) > limit
+    query = query[:limit]
+    if backward:
+        query.reverse()
+
+    edges = [Edge(node=from_mongo(t), cursor=encode_cursor(t, sort_var)) for t in query]
+    return Connection(
+        edges=edges,
+        pageInfo=PageInfo(
+            hasNextPage=before is not None if backward else has_more,
+            hasPreviousPage=has_more if backward else after is not None,
+            startCursor=edges[0].cursor if edges else None,
+            endCursor=edges[-1].cursor if edges else None,
+        ),
+    )
+
+
+def get_adventurers_filter(where: Optional[AdventurersFilter]) -> Dict:
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1230,37 +1451,52 @@ def get_adventurers(
             elif isinstance(value, BooleanFilter):
                 filter[key] = get_bool_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
+    return filter
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
 
-    query = (
-        db["adventurers"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
+async def get_adventurers(
+    info,
+    where: Optional[AdventurersFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[AdventurersOrderByInput] = {},
+) -> List[Adventurer]:
+    sort_var, sort_dir = get_sort(orderBy)
+    query = await find_documents(
+        info,
+        "adventurers",
+        get_adventurers_filter(where),
+        skip,
+        limit,
+        sort_var,
+        sort_dir,
     )
-
     return [Adventurer.from_mongo(t) for t in query]
 
 
-def get_scores(
+async def get_adventurers_connection(
     info,
-    where: Optional[ScoresFilter] = {},
-    limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[ScoresOrderByInput] = {},
-) -> List[Score]:
-    db = info.context["db"]
+    where: Optional[AdventurersFilter] = {},
+    orderBy: Optional[AdventurersOrderByInput] = {},
+    first: Optional[int] = None,
+    after: Optional[str] = None,
+    last: Optional[int] = None,
+    before: Optional[str] = None,
+) -> Connection[Adventurer]:
+    return await find_connection(
+        info,
+        "adventurers",
+        Adventurer.from_mongo,
+        get_adventurers_filter(where),
+        get_sort(orderBy),
+        first,
+        after,
+        last,
+        before,
+    )
+
 
+def get_scores_filter(where: Optional[ScoresFilter]) -> Dict:
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1275,35 +1511,46 @@ def get_scores(
             elif isinstance(value, FeltValueFilter):
                 filter[key] = get_felt_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
-
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
+    return filter
 
-    query = db["scores"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
 
+async def get_scores(
+    info,
+    where: Optional[ScoresFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[ScoresOrderByInput] = {},
+) -> List[Score]:
+    sort_var, sort_dir = get_sort(orderBy)
+    query = await find_documents(
+        info, "scores", get_scores_filter(where), skip, limit, sort_var, sort_dir
+    )
     return [Score.from_mongo(t) for t in query]
 
 
-def get_discoveries(
+async def get_scores_connection(
     info,
-    where: Optional[DiscoveriesFilter] = {},
-    limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[DiscoveriesOrderByInput] = {},
-) -> List[Discovery]:
-    db = info.context["db"]
+    where: Optional[ScoresFilter] = {},
+    orderBy: Optional[ScoresOrderByInput] = {},
+    first: Optional[int] = None,
+    after: Optional[str] = None,
+    last: Optional[int] = None,
+    before: Optional[str] = None,
+) -> Connection[Score]:
+    return await find_connection(
+        info,
+        "scores",
+        Score.from_mongo,
+        get_scores_filter(where),
+        get_sort(orderBy),
+        first,
+        after,
+        last,
+        before,
+    )
 
+
+def get_discoveries_filter(where: Optional[DiscoveriesFilter]) -> Dict:
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1323,37 +1570,52 @@ def get_discoveries(
             elif isinstance(value, FeltValueFilter):
                 filter[key] = get_felt_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
+    return filter
 
-    sort_var = "updated_at"
-    sort_dir = -1
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
-
-    query = (
-        db["discoveries"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
+async def get_discoveries(
+    info,
+    where: Optional[DiscoveriesFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[DiscoveriesOrderByInput] = {},
+) -> List[Discovery]:
+    sort_var, sort_dir = get_sort(orderBy)
+    query = await find_documents(
+        info,
+        "discoveries",
+        get_discoveries_filter(where),
+        skip,
+        limit,
+        sort_var,
+        sort_dir,
     )
-
     return [Discovery.from_mongo(t) for t in query]
 
 
-def get_beasts(
+async def get_discoveries_connection(
     info,
-    where: Optional[BeastsFilter] = {},
-    limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[BeastsOrderByInput] = {},
-) -> List[Discovery]:
-    db = info.context["db"]
+    where: Optional[DiscoveriesFilter] = {},
+    orderBy: Optional[DiscoveriesOrderByInput] = {},
+    first: Optional[int] = None,
+    after: Optional[str] = None,
+    last: Optional[int] = None,
+    before: Optional[str] = None,
+) -> Connection[Discovery]:
+    return await find_connection(
+        info,
+        "discoveries",
+        Discovery.from_mongo,
+        get_discoveries_filter(where),
+        get_sort(orderBy),
+        first,
+        after,
+        last,
+        before,
+    )
+
 
+def get_beasts_filter(where: Optional[BeastsFilter]) -> Dict:
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1374,35 +1636,46 @@ def get_beasts(
             elif isinstance(value, FeltValueFilter):
                 filter[key] = get_felt_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
-
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
+    return filter
 
-    query = db["beasts"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
 
+async def get_beasts(
+    info,
+    where: Optional[BeastsFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[BeastsOrderByInput] = {},
+) -> List[Discovery]:
+    sort_var, sort_dir = get_sort(orderBy)
+    query = await find_documents(
+        info, "beasts", get_beasts_filter(where), skip, limit, sort_var, sort_dir
+    )
     return [Beast.from_mongo(t) for t in query]
 
 
-def get_battles(
+async def get_beasts_connection(
     info,
-    where: Optional[BattlesFilter] = {},
-    limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[BattlesOrderByInput] = {},
-) -> List[Battle]:
-    db = info.context["db"]
+    where: Optional[BeastsFilter] = {},
+    orderBy: Optional[BeastsOrderByInput] = {},
+    first: Optional[int] = None,
+    after: Optional[str] = None,
+    last: Optional[int] = None,
+    before: Optional[str] = None,
+) -> Connection[Beast]:
+    return await find_connection(
+        info,
+        "beasts",
+        Beast.from_mongo,
+        get_beasts_filter(where),
+        get_sort(orderBy),
+        first,
+        after,
+        last,
+        before,
+    )
 
+
+def get_battles_filter(where: Optional[BattlesFilter]) -> Dict:
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1419,35 +1692,46 @@ def get_battles(
             elif isinstance(value, BooleanFilter):
                 filter[key] = get_bool_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
-
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
+    return filter
 
-    query = db["battles"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
 
+async def get_battles(
+    info,
+    where: Optional[BattlesFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[BattlesOrderByInput] = {},
+) -> List[Battle]:
+    sort_var, sort_dir = get_sort(orderBy)
+    query = await find_documents(
+        info, "battles", get_battles_filter(where), skip, limit, sort_var, sort_dir
+    )
     return [Battle.from_mongo(t) for t in query]
 
 
-def get_items(
+async def get_battles_connection(
     info,
-    where: Optional[ItemsFilter] = {},
-    limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[ItemsOrderByInput] = {},
-) -> List[Item]:
-    db = info.context["db"]
+    where: Optional[BattlesFilter] = {},
+    orderBy: Optional[BattlesOrderByInput] = {},
+    first: Optional[int] = None,
+    after: Optional[str] = None,
+    last: Optional[int] = None,
+    before: Optional[str] = None,
+) -> Connection[Battle]:
+    return await find_connection(
+        info,
+        "battles",
+        Battle.from_mongo,
+        get_battles_filter(where),
+        get_sort(orderBy),
+        first,
+        after,
+        last,
+        before,
+    )
+
 
+def get_items_filter(where: Optional[ItemsFilter]) -> Dict:
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1474,22 +1758,58 @@ def get_items(
             elif isinstance(value, BooleanFilter):
                 filter[key] = get_bool_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
+    return filter
 
-    sort_var = "updated_at"
-    sort_dir = -1
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
-    query = db["items"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
+async def get_items(
+    info,
+    where: Optional[ItemsFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[ItemsOrderByInput] = {},
+) -> List[Item]:
+    sort_var, sort_dir = get_sort(orderBy)
+    query = await find_documents(
+        info, "items", get_items_filter(where), skip, limit, sort_var, sort_dir
+    )
+    return [Item.from_mongo(t) for t in query]
+
+
+async def get_items_connection(
+    info,
+    where: Optional[ItemsFilter] = {},
+    orderBy: Optional[ItemsOrderByInput] = {},
+    first: Optional[int] = None,
+    after: Optional[str] = None,
+    last: Optional[int] = None,
+    before: Optional[str] = None,
+) -> Connection[Item]:
+    return await find_connection(
+        info,
+        "items",
+        Item.from_mongo,
+        get_items_filter(where),
+        get_sort(orderBy),
+        first,
+        after,
+        last,
+        before,
+    )
+
 
+async def get_market_items(
+    info,
+    where: Optional[ItemsFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[ItemsOrderByInput] = {},
+) -> List[Item]:
+    """Items currently offered to the adventurers, a purchased item stays
+    offered with `owner` set until the next offers."""
+    sort_var, sort_dir = get_sort(orderBy)
+    query = await find_documents(
+        info, "market_items", get_items_filter(where), skip, limit, sort_var, sort_dir
+    )
     return [Item.from_mongo(t) for t in query]
 
 
@@ -1501,30 +1821,200 @@ class Query:
     beasts: List[Beast] = strawberry.field(resolver=get_beasts)
     battles: List[Battle] = strawberry.field(resolver=get_battles)
     items: List[Item] = strawberry.field(resolver=get_items)
+    marketItems: List[Item] = strawberry.field(resolver=get_market_items)
+    adventurersConnection: Connection[Adventurer] = strawberry.field(
+        resolver=get_adventurers_connection
+    )
+    scoresConnection: Connection[Score] = strawberry.field(
+        resolver=get_scores_connection
+    )
+    discoveriesConnection: Connection[Discovery] = strawberry.field(
+        resolver=get_discoveries_connection
+    )
+    beastsConnection: Connection[Beast] = strawberry.field(
+        resolver=get_beasts_connection
+    )
+    battlesConnection: Connection[Battle] = strawberry.field(
+        resolver=get_battles_connection
+    )
+    itemsConnection: Connection[Item] = strawberry.field(resolver=get_items_connection)
+
+
+def get_cache_key(network, request_data, allowed_operation_types):
+    """Return the cache key of a request, `None` if it can't be cached or
+    would be rejected with `allowed_operation_types`."""
+    try:
+        document = parse(request_data.query)
+        operation_type = get_operation_type(document, request_data.operation_name)
+    except (GraphQLError, RuntimeError, TypeError):
+        return None
+    if operation_type != OperationType.QUERY or (
+        operation_type not in allowed_operation_types
+    ):
+        return None
+    variables = json.dumps(request_data.variables, sort_keys=True)
+    return (network, print_ast(document), variables, request_data.operation_name)
+
+
+class CachedHTTPHandler(HTTPHandler):
+    """Serve repeated queries from `cache` until the indexed data changes.
+
+    Follows `HTTPHandler.execute_request`, so that a cached response is only
+    returned to a request the schema would execute.
+    """
+
+    def __init__(self, *args, cache, network, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.network = network
+
+    async def execute_request(self, request, request_data, method):
+        allowed_operation_types = OperationType.from_http(method)
+        if not self.allow_queries_via_get and method == "GET":
+            allowed_operation_types = allowed_operation_types - {OperationType.QUERY}
+
+        key = get_cache_key(self.network, request_data, allowed_operation_types)
+        if key is not None:
+            body = self.cache.get(key)
+            if body is not None:
+                return web.Response(body=body, content_type="application/json")
+
+        # The response may be from the previous block if the cursor moves while
+        # the query runs
+        generation = self.cache.generation(self.network)
+        response = web.Response()
+        context = await self.get_context(request, response)
+        root_value = await self.get_root_value(request)
+        try:
+            result = await self.schema.execute(
+                query=request_data.query,
+                root_value=root_value,
+                variable_values=request_data.variables,
+                context_value=context,
+                operation_name=request_data.operation_name,
+                allowed_operation_types=allowed_operation_types,
+            )
+        except InvalidOperationTypeError as e:
+            raise web.HTTPBadRequest(
+                reason=e.as_http_error_reason(method=method)
+            ) from e
+        except MissingQueryError:
+            raise web.HTTPBadRequest(reason="No GraphQL query found in the request")
+
+        response_data = await self.process_result(request, result)
+        response.text = self.encode_json(response_data)
+        response.content_type = "application/json"
+
+        if (
+            key is not None
+            and not result.errors
+            and self.cache.generation(self.network) == generation
+        ):
+            self.cache.set(key, response.body)
+        return response
+
+
+async def watch_indexer_cursor(db, executor, cache, network, interval=1):
+    """Invalidate the cached responses of `network` whenever the indexer
+    cursor moves, including rollbacks."""
+    context = {"executor": executor}
+    state = None
+    while True:
+        try:
+            cursor = db["_apibara"].find({}, {"_id": 0, "indexer_id": 1, "cursor": 1})
+            new_state = await fetch_documents(context, cursor)
+        except Exception as e:
+            logger.warning("Failed to read the indexer cursor of %s: %s", network, e)
+            new_state = None
+        if new_state is None or new_state != state:
+            cache.invalidate_namespace(network)
+        state = new_state
+        await asyncio.sleep(interval)
 
 
 class IndexerGraphQLView(GraphQLView):
-    def __init__(self, db, **kwargs):
+    def __init__(
+        self, db, executor=None, cache=None, network=None, compact=False, **kwargs
+    ):
         super().__init__(**kwargs)
         self._db = db
+        self._executor = executor
+        self._compact = compact
+        if cache is not None:
+            self.http_handler_class = partial(
+                CachedHTTPHandler, cache=cache, network=network
+            )
 
     async def get_context(self, _request, _response):
-        return {"db": self._db}
-
+        context = {
+            "db": self._db,
+            "executor": self._executor,
+            "compact": self._compact,
+        }
+        context["loaders"] = get_loaders(context)
+        return context
+
+
+async def run_graphql_api(
+    mongo_goerli=None,
+    mongo_mainnet=None,
+    port="8080",
+    pool_size=100,
+    executor=False,
+    cache_size=64,
+):
+    configure_logging()
 
-async def run_graphql_api(mongo_goerli=None, mongo_mainnet=None, port="8080"):
-    mongo_goerli = MongoClient(mongo_goerli)
-    mongo_mainnet = MongoClient(mongo_mainnet)
     db_name_goerli = "mongo-goerli".replace("-", "_")
     db_name_mainnet = "mongo-mainnet".replace("-", "_")
-    db_goerli = mongo_goerli[db_name_goerli]
-    db_mainnet = mongo_mainnet[db_name_mainnet]
+
+    with MongoClient(mongo_goerli) as client:
+        ensure_indexes(client[db_name_goerli])
+        compact_goerli = get_storage_version(client[db_name_goerli]) == COMPACT_STORAGE
+    with MongoClient(mongo_mainnet) as client:
+        ensure_indexes(client[db_name_mainnet])
+        compact_mainnet = (
+            get_storage_version(client[db_name_mainnet]) == COMPACT_STORAGE
+        )
+
+    if AsyncIOMotorClient is None:
+        executor = True
+
+    if executor:
+        # Fallback mode: blocking driver, queries run in a bounded thread pool
+        client_goerli = MongoClient(mongo_goerli, maxPoolSize=pool_size)
+        client_mainnet = MongoClient(mongo_mainnet, maxPoolSize=pool_size)
+        query_executor = ThreadPoolExecutor(max_workers=pool_size)
+    else:
+        client_goerli = AsyncIOMotorClient(mongo_goerli, maxPoolSize=pool_size)
+        client_mainnet = AsyncIOMotorClient(mongo_mainnet, maxPoolSize=pool_size)
+        query_executor = None
+
+    db_goerli = client_goerli[db_name_goerli]
+    db_mainnet = client_mainnet[db_name_mainnet]
+
+    # Responses only change when a block is indexed, cache them in between
+    cache = None
+    if cache_size:
+        cache = ResponseCache(cache_size * 1024 * 1024)
+        for db, network in [(db_goerli, "goerli"), (db_mainnet, "mainnet")]:
+            asyncio.create_task(
+                watch_indexer_cursor(db, query_executor, cache, network)
+            )
 
     schema = strawberry.Schema(query=Query)
-    view_goerli = IndexerGraphQLView(db_goerli, schema=schema)
-    view_mainnet = IndexerGraphQLView(db_mainnet, schema=schema)
+    view_goerli = IndexerGraphQLView(
+        db_goerli, query_executor, cache, "goerli", compact_goerli, schema=schema
+    )
+    view_mainnet = IndexerGraphQLView(
+        db_mainnet, query_executor, cache, "mainnet", compact_mainnet, schema=schema
+    )
+
+    async def cache_stats(_request):
+        return web.json_response(cache.stats() if cache is not None else {})
 
     app = web.Application()
+    app.router.add_get("/cache", cache_stats)
     # app.router.add_route("*", "/graphql", view_goerli)
 
     cors = aiohttp_cors.setup(app)
@@ -1570,7 +2060,12 @@ async def run_graphql_api(mongo_goerli=None, mongo_mainnet=None, port="8080"):
     site = web.TCPSite(runner, "0.0.0.0", int(port))
     await site.start()
 
-    print(f"GraphQL server started on port {port}")
+    logger.info(
+        "GraphQL server started on port %s (%s driver, pool size %s)",
+        port,
+        "thread pool" if executor else "async",
+        pool_size,
+    )
 
     while True:
         await asyncio.sleep(5_000)
@@ -1,9 +1,14 @@
+import asyncio
 import os
-import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from datetime import datetime
+from functools import partial
 
 from apibara.indexer import IndexerRunner, IndexerRunnerConfiguration, Info
 from apibara.indexer.indexer import IndexerConfiguration
+from apibara.indexer.storage import IndexerStorage
 from apibara.protocol.proto.stream_pb2 import Cursor, DataFinality
 from apibara.starknet import EventFilter, Filter, StarkNetIndexer, felt
 from apibara.starknet.cursor import starknet_cursor
@@ -12,40 +17,29 @@ from starknet_py.contract import ContractFunction
 from apibara.starknet.proto.types_pb2 import FieldElement
 
 from typing import List
+from indexer.archive import BlockRecorder, read_blocks
+from indexer import metrics
+from indexer.cache import LRUCache
+from indexer.compact import check_storage_version
 from indexer.config import Config
-from indexer.decoder import (
-    decode_start_game_event,
-    decode_stat_upgrades_available_event,
-    decode_strength_increased_event,
-    decode_dexterity_increased_event,
-    decode_vitality_increased_event,
-    decode_intelligence_increased_event,
-    decode_wisdom_increased_event,
-    decode_charisma_increased_event,
-    decode_discover_health_event,
-    decode_discover_gold_event,
-    decode_discover_xp_event,
-    decode_dodged_obstacle_event,
-    decode_hit_by_obstacle_event,
-    decode_ambushed_by_beast_event,
-    decode_discover_beast_event,
-    decode_attack_beast_event,
-    decode_attacked_by_beast_event,
-    decode_slayed_beast_event,
-    decode_flee_failed_event,
-    decode_flee_succeeded_event,
-    decode_purchased_item_event,
-    decode_equipped_item_event,
-    decode_dropped_item_event,
-    decode_greatness_increased_event,
-    decode_item_special_unlocked_event,
-    decode_purchased_potion_event,
-    decode_new_high_score_event,
-    decode_adventurer_died_event,
-    decode_adventurer_leveled_up_event,
-    decode_new_items_available_event,
-    decode_idle_damage_penalty_event,
+from indexer.indexes import INDEXES, ensure_indexes
+from indexer.journal import (
+    COLLECTION as JOURNAL,
+    check_journal_coverage,
+    journal_document,
+    read_journal,
 )
+from indexer.log import (
+    IndexerLogger,
+    configure_logging,
+    current_block,
+    current_event,
+    stop_logging,
+)
+from indexer.pending import PendingBlockStorage
+from indexer.shards import ShardPool, event_adventurer_id
+from indexer.snapshot import Snapshots
+from indexer.decoder import decode_events
 from indexer.utils import (
     felt_to_str,
     str_to_felt,
@@ -56,12 +50,9 @@ from indexer.utils import (
     get_key_by_value,
     create_uid,
 )
+from indexer.writer import BlockWriter
 
-# Print apibara logs
-root_logger = logging.getLogger("apibara")
-# change to `logging.DEBUG` to print more information
-root_logger.setLevel(logging.INFO)
-root_logger.addHandler(logging.StreamHandler())
+logger = IndexerLogger(__name__)
 
 
 def encode_str_as_bytes(value):
@@ -73,8 +64,8 @@ def encode_hex_as_bytes(value):
     return bytes.fromhex(value.replace("0x", ""))
 
 
-async def update_adventurer_helper(info: Info, adventurer_state, time):
-    update_adventurer_doc = {
+def get_adventurer_doc(adventurer_state):
+    return {
         "id": check_exists_int(adventurer_state["adventurer_id"]),
         "owner": check_exists_int(adventurer_state["owner"]),
         "lastAction": check_exists_int(adventurer_state["adventurer"]["last_action"]),
@@ -111,9 +102,24 @@ async def update_adventurer_helper(info: Info, adventurer_state, time):
         "statUpgrades": check_exists_int(
             adventurer_state["adventurer"]["stat_points_available"]
         ),
-        "lastUpdatedTime": time,
-        "timestamp": datetime.now(),
     }
+
+
+async def update_adventurer_helper(info: Info, adventurer_state, time, cache=None):
+    adventurer_doc = get_adventurer_doc(adventurer_state)
+    # Only write the fields that changed since the last known state
+    update_adventurer_doc = adventurer_doc
+    if cache is not None:
+        cached = cache.get(adventurer_state["adventurer_id"])
+        if cached is not None:
+            update_adventurer_doc = {
+                key: value
+                for key, value in adventurer_doc.items()
+                if cached.get(key) != value
+            }
+        cache.set(adventurer_state["adventurer_id"], adventurer_doc)
+    update_adventurer_doc["lastUpdatedTime"] = time
+    update_adventurer_doc["timestamp"] = datetime.now()
     await info.storage.find_one_and_update(
         "adventurers",
         {
@@ -178,6 +184,31 @@ async def update_beast_health(
     )
 
 
+def item_key(adventurer_id, item_id):
+    """Filter of the item `item_id` owned by `adventurer_id`.
+
+    An adventurer owns a single item of each id, so items are updated by this
+    key without being looked up first.
+    """
+    return {
+        "item": check_exists_int(item_id),
+        "adventurerId": check_exists_int(adventurer_id),
+        "owner": True,
+    }
+
+
+def prune_market_items(db, before_block, session=None):
+    """Delete the market offers replaced before `before_block`.
+
+    Every `NewItemsAvailable` replaces the offers of an adventurer, and the
+    replaced versions are otherwise kept forever."""
+    return (
+        db["market_items"]
+        .delete_many({"_chain.valid_to": {"$lt": before_block}}, session=session)
+        .deleted_count
+    )
+
+
 async def get_item(info, item_id, adventurer_id):
     item = await info.storage.find_one(
         "items",
@@ -192,88 +223,56 @@ async def get_item(info, item_id, adventurer_id):
 async def update_items_xp(info, adventurer_id, adventurer):
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["weapon"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["weapon"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["weapon"]["xp"])},
         },
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["chest"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["chest"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["chest"]["xp"])},
         },
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["head"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["head"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["head"]["xp"])},
         },
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["waist"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["waist"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["waist"]["xp"])},
         },
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["foot"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["foot"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["foot"]["xp"])},
         },
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["hand"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["hand"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["hand"]["xp"])},
         },
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["neck"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["neck"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["neck"]["xp"])},
         },
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(adventurer["ring"]["id"]),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, adventurer["ring"]["id"]),
         {
             "$set": {"xp": encode_int_as_bytes(adventurer["ring"]["xp"])},
         },
@@ -283,11 +282,7 @@ async def update_items_xp(info, adventurer_id, adventurer):
 async def swap_item(info, adventurer_id, equipped_item, unequipped_item, time):
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(equipped_item),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, equipped_item),
         {
             "$set": {
                 "equipped": True,
@@ -298,11 +293,7 @@ async def swap_item(info, adventurer_id, equipped_item, unequipped_item, time):
     )
     await info.storage.find_one_and_update(
         "items",
-        {
-            "item": check_exists_int(unequipped_item),
-            "adventurerId": check_exists_int(adventurer_id),
-            "owner": True,
-        },
+        item_key(adventurer_id, unequipped_item),
         {
             "$set": {
                 "equipped": False,
@@ -332,9 +323,32 @@ async def swap_item(info, adventurer_id, equipped_item, unequipped_item, time):
 
 
 class LootSurvivorIndexer(StarkNetIndexer):
-    def __init__(self, config):
+    def __init__(self, config, recorder=None, shards=None, snapshots=None):
         super().__init__()
         self.config = config
+        # Archive of the accepted blocks, see `indexer record`
+        self.recorder = recorder
+        # Worker processes applying the accepted blocks, see `indexer.shards`
+        self.shards = shards
+        # Periodic snapshots of the database, see `indexer.snapshot`
+        self.snapshots = snapshots
+        # Set by the runner, see `indexer.pending`
+        self.pending_storage = None
+        # Latest known adventurer documents, used to only write changed fields.
+        # Only updated from accepted blocks since pending data gets rolled back.
+        self.adventurers = LRUCache(config.ADVENTURER_CACHE_SIZE)
+        self.adventurer_cache = None
+        # Discovery time of the beasts, keyed by (adventurer_id, beast, seed).
+        # Also only updated from accepted blocks.
+        self.discovery_times = LRUCache(config.DISCOVERY_CACHE_SIZE)
+        self.discovery_cache = None
+        self.storage_ready = False
+        # Block of the last pruning of the market offers
+        self.market_pruned_block = None
+        # Threads running the MongoDB reads of concurrent handlers
+        self.query_executor = None
+        if config.HANDLER_CONCURRENCY > 1:
+            self.query_executor = ThreadPoolExecutor(config.HANDLER_CONCURRENCY)
 
     def indexer_id(self) -> str:
         return f"mongo-{self.config.network}"
@@ -343,7 +357,7 @@ class LootSurvivorIndexer(StarkNetIndexer):
         # Return initial configuration of the indexer.
         filter = Filter().with_header(weak=True)
         self.event_map = dict()
-        self.handle_pending_data = self.handle_data
+        self.handle_pending_data = partial(self.handle_data, pending=True)
 
         def add_filter(contract, event):
             selector = ContractFunction.get_selector(event)
@@ -388,59 +402,246 @@ class LootSurvivorIndexer(StarkNetIndexer):
         ]:
             add_filter(self.config.GAME_CONTRACT, survivor_event)
 
+        # Export all the event counters, even before their first event
+        for event_name in self.event_map.values():
+            metrics.EVENTS.inc(event_name, value=0)
+
         return IndexerConfiguration(
             filter=filter,
             starting_cursor=starknet_cursor(self.config.STARTING_BLOCK),
             finality=DataFinality.DATA_STATUS_PENDING,
         )
 
-    async def handle_data(self, info: Info, data: Block):
+    async def handle_data(self, info: Info, data: Block, pending=False):
+        started = time.perf_counter()
         block_time = data.header.timestamp.ToDatetime()
-        print(f"Indexing block {data.header.block_number} at {block_time}")
+        current_block.set(data.header.block_number)
+        current_event.set(None)
+        logger.info("Indexing block %s at %s", data.header.block_number, block_time)
         # Handle one block of data
 
-        for event_with_tx in data.events:
-            event = event_with_tx.event
-            event_name = self.event_map[felt.to_int(event.keys[0])]
-
-            await {
-                "StartGame": self.start_game,
-                "StrengthIncreased": self.stat_upgrade,
-                "DexterityIncreased": self.stat_upgrade,
-                "VitalityIncreased": self.stat_upgrade,
-                "IntelligenceIncreased": self.stat_upgrade,
-                "WisdomIncreased": self.stat_upgrade,
-                "CharismaIncreased": self.stat_upgrade,
-                "DiscoveredHealth": self.discover_health,
-                "DiscoveredGold": self.discover_gold,
-                "DiscoveredXP": self.discover_xp,
-                "DodgedObstacle": self.dodged_obstacle,
-                "HitByObstacle": self.hit_by_obstacle,
-                "DiscoveredBeast": self.discover_beast,
-                "AmbushedByBeast": self.ambushed_by_beast,
-                "AttackedBeast": self.attack_beast,
-                "AttackedByBeast": self.attacked_by_beast,
-                "SlayedBeast": self.slayed_beast,
-                "FleeFailed": self.flee_failed,
-                "FleeSucceeded": self.flee_succeeded,
-                "PurchasedItem": self.purchased_item,
-                "EquippedItem": self.equipped_item,
-                "DroppedItem": self.dropped_item,
-                "GreatnessIncreased": self.greatness_increased,
-                "ItemSpecialUnlocked": self.item_special_unlocked,
-                "PurchasedPotion": self.purchased_potion,
-                "NewHighScore": self.new_high_score,
-                "AdventurerDied": self.adventurer_died,
-                "AdventurerLeveledUp": self.adventurer_leveled_up,
-                "NewItemsAvailable": self.new_items_available,
-                "IdleDamagePenalty": self.idle_damage_penalty,
-            }[event_name](
-                info,
-                block_time,
-                event.from_address,
-                felt.to_hex(event_with_tx.transaction.meta.hash),
-                event.data,
+        # Create the indexes on the first block, after apibara has (maybe)
+        # dropped the database on restart
+        if not self.storage_ready:
+            ensure_indexes(info.storage._db)
+            check_storage_version(info.storage._db, self.config.COMPACT_STORAGE)
+            self.storage_ready = True
+
+        # Skip the events already applied with the previous pending block
+        block = data
+        if self.pending_storage is not None:
+            pending_block = self.pending_storage.pending_block
+            applied = self.pending_storage.applied_events(data)
+            if applied == 0 and pending_block is not None:
+                # The previous pending block was dropped
+                await self.forget_adventurers(pending_block)
+            if applied > 0:
+                block = Block(header=data.header)
+                block.events.extend(data.events[applied:])
+                if not pending:
+                    # They were applied without updating the caches
+                    skipped = Block(header=data.header)
+                    skipped.events.extend(data.events[:applied])
+                    await self.forget_adventurers(skipped)
+
+        if self.shards is not None and not pending:
+            # Apply the events of each adventurer in its shard process
+            await self.shards.apply(info, block, self.event_names(block))
+        else:
+            await self.apply_block(info, block, pending)
+
+        if self.pending_storage is not None:
+            self.pending_storage.set_applied(data, pending)
+        if self.recorder is not None and not pending:
+            self.recorder.write(data)
+        if not pending:
+            self.maybe_prune_market_items(info)
+        if self.snapshots is not None and not pending:
+            self.snapshots.maybe_write(info.storage._db, info.end_cursor)
+
+        status = "pending" if pending else "accepted"
+        metrics.BLOCKS.inc(status)
+        metrics.BLOCK_NUMBER.set(data.header.block_number, status)
+        metrics.BLOCK_LAG.set(time.time() - data.header.timestamp.seconds, status)
+        metrics.BLOCK_SECONDS.observe(time.perf_counter() - started, status)
+
+    def maybe_prune_market_items(self, info: Info):
+        block_number = info.end_cursor.order_key
+        history = self.config.MARKET_HISTORY_BLOCKS
+        if (
+            self.market_pruned_block is not None
+            and block_number - self.market_pruned_block < history
+        ):
+            return
+        pruned = prune_market_items(
+            info.storage._db, block_number - history, info.storage._session
+        )
+        self.market_pruned_block = block_number
+        logger.info("Pruned %s replaced market offers", pruned)
+
+    async def clear_caches(self):
+        self.adventurers.clear()
+        self.discovery_times.clear()
+        if self.shards is not None:
+            await self.shards.clear_caches()
+
+    async def forget_adventurers(self, data: Block):
+        """Drop the adventurers of the events of `data` from the caches."""
+        records = decode_events(
+            self.event_names(data),
+            [event_with_tx.event for event_with_tx in data.events],
+        )
+        adventurer_ids = {event_adventurer_id(record) for record in records}
+        for adventurer_id in adventurer_ids:
+            self.adventurers.pop(adventurer_id)
+        self.discovery_times.invalidate(lambda key: key[0] in adventurer_ids)
+        if self.shards is not None:
+            await self.shards.forget_adventurers(adventurer_ids)
+
+    def event_names(self, data: Block):
+        return [
+            self.event_map[felt.to_int(event_with_tx.event.keys[0])]
+            for event_with_tx in data.events
+        ]
+
+    async def apply_block(self, info: Info, data: Block, pending=False):
+        block_time = data.header.timestamp.ToDatetime()
+
+        # Buffer the writes of all handlers and flush them once per block
+        writer = BlockWriter(
+            info.storage._db,
+            info.end_cursor.order_key,
+            session=info.storage._session,
+            compact=self.config.COMPACT_STORAGE,
+            executor=self.query_executor,
+        )
+        block_info = replace(info, storage=writer)
+        self.adventurer_cache = None if pending else self.adventurers
+        self.discovery_cache = None if pending else self.discovery_times
+
+        # Decode the events of the block in one batch per event type
+        started = time.perf_counter()
+        event_names = self.event_names(data)
+        records = decode_events(
+            event_names, [event_with_tx.event for event_with_tx in data.events]
+        )
+        metrics.DECODE_SECONDS.observe(time.perf_counter() - started)
+
+        if self.config.JOURNAL:
+            for event_with_tx in data.events:
+                await writer.insert_one(JOURNAL, *journal_document(data, event_with_tx))
+
+        # Events of different adventurers are independent, handle each
+        # adventurer's events in order and the adventurers concurrently
+        adventurer_events = {}
+        for event in zip(data.events, event_names, records):
+            adventurer_events.setdefault(event_adventurer_id(event[2]), []).append(
+                event
             )
+        concurrency = asyncio.Semaphore(self.config.HANDLER_CONCURRENCY)
+
+        async def handle_events(events):
+            async with concurrency:
+                for event_with_tx, event_name, record in events:
+                    await self.handle_event(
+                        block_info, block_time, event_with_tx, event_name, record
+                    )
+
+        try:
+            results = await asyncio.gather(
+                *[handle_events(events) for events in adventurer_events.values()],
+                return_exceptions=True,
+            )
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                raise errors[0]
+
+            current_event.set(None)
+            await writer.flush()
+        except Exception:
+            # The cached adventurers may be ahead of what was written
+            self.adventurers.clear()
+            raise
+
+    async def handle_event(
+        self, info: Info, block_time, event_with_tx, event_name, record
+    ):
+        started = time.perf_counter()
+        current_event.set(event_name)
+        event = event_with_tx.event
+        tx_hash = event_with_tx.transaction.meta.hash
+        # Documents get ids derived from the event, see `EventWriter`
+        info = replace(
+            info,
+            storage=info.storage.for_event(
+                felt.to_int(tx_hash),
+                event_with_tx.receipt.transaction_index,
+                event.index,
+            ),
+        )
+        await {
+            "StartGame": self.start_game,
+            "StrengthIncreased": self.stat_upgrade,
+            "DexterityIncreased": self.stat_upgrade,
+            "VitalityIncreased": self.stat_upgrade,
+            "IntelligenceIncreased": self.stat_upgrade,
+            "WisdomIncreased": self.stat_upgrade,
+            "CharismaIncreased": self.stat_upgrade,
+            "DiscoveredHealth": self.discover_health,
+            "DiscoveredGold": self.discover_gold,
+            "DiscoveredXP": self.discover_xp,
+            "DodgedObstacle": self.dodged_obstacle,
+            "HitByObstacle": self.hit_by_obstacle,
+            "DiscoveredBeast": self.discover_beast,
+            "AmbushedByBeast": self.ambushed_by_beast,
+            "AttackedBeast": self.attack_beast,
+            "AttackedByBeast": self.attacked_by_beast,
+            "SlayedBeast": self.slayed_beast,
+            "FleeFailed": self.flee_failed,
+            "FleeSucceeded": self.flee_succeeded,
+            "PurchasedItem": self.purchased_item,
+            "EquippedItem": self.equipped_item,
+            "DroppedItem": self.dropped_item,
+            "GreatnessIncreased": self.greatness_increased,
+            "ItemSpecialUnlocked": self.item_special_unlocked,
+            "PurchasedPotion": self.purchased_potion,
+            "NewHighScore": self.new_high_score,
+            "AdventurerDied": self.adventurer_died,
+            "AdventurerLeveledUp": self.adventurer_leveled_up,
+            "NewItemsAvailable": self.new_items_available,
+            "IdleDamagePenalty": self.idle_damage_penalty,
+        }[event_name](
+            info,
+            block_time,
+            event.from_address,
+            felt.to_hex(tx_hash),
+            record,
+        )
+        metrics.EVENTS.inc(event_name)
+        metrics.HANDLER_SECONDS.observe(time.perf_counter() - started, event_name)
+
+    async def get_discovery_time(self, info: Info, beast, adventurer_id, seed):
+        key = (adventurer_id, beast, seed)
+        discovery_time = self.discovery_times.get(key)
+        if discovery_time is not None:
+            return discovery_time
+        # Not seen since the indexer started, look it up in storage
+        beast_discovery = await info.storage.find(
+            "discoveries",
+            {
+                "entity": check_exists_int(beast),
+                "adventurerId": check_exists_int(adventurer_id),
+                "seed": encode_int_as_bytes(seed),
+            },
+            sort={"discoveryTime": -1},
+            limit=1,
+        )
+        beast_document = next(beast_discovery, None)
+        if beast_document is None:
+            return None
+        if self.discovery_cache is not None:
+            self.discovery_cache.set(key, beast_document["discoveryTime"])
+        return beast_document["discoveryTime"]
 
     async def start_game(
         self,
@@ -448,52 +649,10 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        sg,
     ):
-        sg = decode_start_game_event.deserialize([felt.to_int(i) for i in data])
         start_game_doc = {
-            "id": check_exists_int(sg.adventurer_state["adventurer_id"]),
-            "owner": check_exists_int(sg.adventurer_state["owner"]),
-            "lastAction": check_exists_int(
-                sg.adventurer_state["adventurer"]["last_action"]
-            ),
-            "health": encode_int_as_bytes(sg.adventurer_state["adventurer"]["health"]),
-            "xp": encode_int_as_bytes(sg.adventurer_state["adventurer"]["xp"]),
-            "strength": encode_int_as_bytes(
-                sg.adventurer_state["adventurer"]["stats"]["strength"]
-            ),
-            "dexterity": encode_int_as_bytes(
-                sg.adventurer_state["adventurer"]["stats"]["dexterity"]
-            ),
-            "vitality": encode_int_as_bytes(
-                sg.adventurer_state["adventurer"]["stats"]["vitality"]
-            ),
-            "intelligence": encode_int_as_bytes(
-                sg.adventurer_state["adventurer"]["stats"]["intelligence"]
-            ),
-            "wisdom": encode_int_as_bytes(
-                sg.adventurer_state["adventurer"]["stats"]["wisdom"]
-            ),
-            "charisma": encode_int_as_bytes(
-                sg.adventurer_state["adventurer"]["stats"]["charisma"]
-            ),
-            "gold": encode_int_as_bytes(sg.adventurer_state["adventurer"]["gold"]),
-            "weapon": check_exists_int(
-                sg.adventurer_state["adventurer"]["weapon"]["id"]
-            ),
-            "chest": check_exists_int(sg.adventurer_state["adventurer"]["chest"]["id"]),
-            "head": check_exists_int(sg.adventurer_state["adventurer"]["head"]["id"]),
-            "waist": check_exists_int(sg.adventurer_state["adventurer"]["waist"]["id"]),
-            "foot": check_exists_int(sg.adventurer_state["adventurer"]["foot"]["id"]),
-            "hand": check_exists_int(sg.adventurer_state["adventurer"]["hand"]["id"]),
-            "neck": check_exists_int(sg.adventurer_state["adventurer"]["neck"]["id"]),
-            "ring": check_exists_int(sg.adventurer_state["adventurer"]["ring"]["id"]),
-            "beastHealth": check_exists_int(
-                sg.adventurer_state["adventurer"]["beast_health"]
-            ),
-            "statUpgrades": check_exists_int(
-                sg.adventurer_state["adventurer"]["stat_points_available"]
-            ),
+            **get_adventurer_doc(sg.adventurer_state),
             "name": check_exists_int(sg.adventurer_meta["name"]),
             "homeRealm": check_exists_int(sg.adventurer_meta["home_realm"]),
             "classType": check_exists_int(sg.adventurer_meta["class"]),
@@ -503,6 +662,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("adventurers", start_game_doc)
+        if self.adventurer_cache is not None:
+            self.adventurer_cache.set(
+                sg.adventurer_state["adventurer_id"],
+                get_adventurer_doc(sg.adventurer_state),
+            )
         start_item_doc = {
             "item": check_exists_int(sg.adventurer_state["adventurer"]["weapon"]["id"]),
             "adventurerId": check_exists_int(sg.adventurer_state["adventurer_id"]),
@@ -520,10 +684,9 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("items", start_item_doc)
-        print(
-            "- [start game]",
+        logger.info(
+            "start game %s -> %s",
             sg.adventurer_state["adventurer_id"],
-            "->",
             hex(sg.adventurer_state["owner"]),
         )
 
@@ -533,11 +696,12 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        su,
     ):
-        su = decode_strength_increased_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, su.adventurer_state, block_time)
-        print("- [stat upgrade]", su.adventurer_state["adventurer_id"])
+        await update_adventurer_helper(
+            info, su.adventurer_state, block_time, self.adventurer_cache
+        )
+        logger.info("stat upgrade %s", su.adventurer_state["adventurer_id"])
 
     async def discover_health(
         self,
@@ -545,10 +709,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        dh,
     ):
-        dh = decode_discover_health_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, dh.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, dh.adventurer_state, block_time, self.adventurer_cache
+        )
         # subDiscoveries - 1: health, 2: gold, 3: xp
         discovery_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
@@ -578,10 +743,9 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("discoveries", discovery_doc)
-        print(
-            "- [discovered health]",
+        logger.info(
+            "discovered health %s -> %s",
             dh.adventurer_state["adventurer_id"],
-            "->",
             dh.health_amount,
         )
 
@@ -591,10 +755,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        dg,
     ):
-        dg = decode_discover_gold_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, dg.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, dg.adventurer_state, block_time, self.adventurer_cache
+        )
         # subDiscoveries - 1: health, 2: gold, 3: xp
         discovery_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
@@ -624,10 +789,9 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("discoveries", discovery_doc)
-        print(
-            "- [discovered gold]",
+        logger.info(
+            "discovered gold %s -> %s",
             dg.adventurer_state["adventurer_id"],
-            "->",
             dg.gold_amount,
         )
 
@@ -637,10 +801,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        dx,
     ):
-        dx = decode_discover_xp_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, dx.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, dx.adventurer_state, block_time, self.adventurer_cache
+        )
         # subDiscoveries - 1: health, 2: gold, 3: xp
         discovery_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
@@ -670,11 +835,8 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("discoveries", discovery_doc)
-        print(
-            "- [discovered xp]",
-            dx.adventurer_state["adventurer_id"],
-            "->",
-            dx.xp_amount,
+        logger.info(
+            "discovered xp %s -> %s", dx.adventurer_state["adventurer_id"], dx.xp_amount
         )
 
     async def dodged_obstacle(
@@ -683,10 +845,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        do,
     ):
-        do = decode_dodged_obstacle_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, do.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, do.adventurer_state, block_time, self.adventurer_cache
+        )
         # subDiscoveries - 1: health, 2: gold, 3: xp
         discovery_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
@@ -721,11 +884,8 @@ class LootSurvivorIndexer(StarkNetIndexer):
             do.adventurer_state["adventurer_id"],
             do.adventurer_state["adventurer"],
         )
-        print(
-            "- [dodged obstacle]",
-            do.adventurer_state["adventurer_id"],
-            "->",
-            do.id,
+        logger.info(
+            "dodged obstacle %s -> %s", do.adventurer_state["adventurer_id"], do.id
         )
 
     async def hit_by_obstacle(
@@ -734,10 +894,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        do,
     ):
-        do = decode_hit_by_obstacle_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, do.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, do.adventurer_state, block_time, self.adventurer_cache
+        )
         # subDiscoveries - 1: health, 2: gold, 3: xp
         discovery_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
@@ -772,11 +933,8 @@ class LootSurvivorIndexer(StarkNetIndexer):
             do.adventurer_state["adventurer_id"],
             do.adventurer_state["adventurer"],
         )
-        print(
-            "- [hit by obstacle]",
-            do.adventurer_state["adventurer_id"],
-            "->",
-            do.id,
+        logger.info(
+            "hit by obstacle %s -> %s", do.adventurer_state["adventurer_id"], do.id
         )
 
     async def discover_beast(
@@ -785,10 +943,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        db,
     ):
-        db = decode_discover_beast_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, db.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, db.adventurer_state, block_time, self.adventurer_cache
+        )
         discovery_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
             "adventurerId": check_exists_int(db.adventurer_state["adventurer_id"]),
@@ -819,6 +978,10 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("discoveries", discovery_doc)
+        if self.discovery_cache is not None:
+            self.discovery_cache.set(
+                (db.adventurer_state["adventurer_id"], db.id, db.seed), block_time
+            )
         beast_doc = {
             "beast": check_exists_int(db.id),
             "health": encode_int_as_bytes(
@@ -836,11 +999,8 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("beasts", beast_doc)
-        print(
-            "- [discovered beast]",
-            db.adventurer_state["adventurer_id"],
-            "->",
-            db.id,
+        logger.info(
+            "discovered beast %s -> %s", db.adventurer_state["adventurer_id"], db.id
         )
 
     async def ambushed_by_beast(
@@ -849,10 +1009,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data,
+        abb,
     ):
-        abb = decode_ambushed_by_beast_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, abb.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, abb.adventurer_state, block_time, self.adventurer_cache
+        )
         discovery_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
             "adventurerId": check_exists_int(abb.adventurer_state["adventurer_id"]),
@@ -883,6 +1044,10 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("discoveries", discovery_doc)
+        if self.discovery_cache is not None:
+            self.discovery_cache.set(
+                (abb.adventurer_state["adventurer_id"], abb.id, abb.seed), block_time
+            )
         attacked_by_beast_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
             "beast": check_exists_int(abb.id),
@@ -929,11 +1094,8 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("beasts", beast_doc)
-        print(
-            "- [ambushed by beast]",
-            abb.adventurer_state["adventurer_id"],
-            "->",
-            abb.id,
+        logger.info(
+            "ambushed by beast %s -> %s", abb.adventurer_state["adventurer_id"], abb.id
         )
 
     async def attack_beast(
@@ -942,10 +1104,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        ba,
     ):
-        ba = decode_attack_beast_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, ba.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, ba.adventurer_state, block_time, self.adventurer_cache
+        )
         await update_beast_health(
             info,
             ba.id,
@@ -955,57 +1118,44 @@ class LootSurvivorIndexer(StarkNetIndexer):
             False,
             block_time,
         )
-        try:
-            beast_discovery = await info.storage.find(
-                "discoveries",
-                {
-                    "entity": check_exists_int(ba.id),
-                    "adventurerId": check_exists_int(
-                        ba.adventurer_state["adventurer_id"]
-                    ),
-                    "seed": encode_int_as_bytes(ba.seed),
-                },
-                sort={"discoveryTime": -1},
-                limit=1,
-            )
-            beast_document = next(beast_discovery)
-            attacked_beast_doc = {
-                "txHash": encode_hex_as_bytes(tx_hash),
-                "beast": check_exists_int(ba.id),
-                "beastHealth": encode_int_as_bytes(
-                    ba.adventurer_state["adventurer"]["beast_health"]
-                ),
-                "beastLevel": encode_int_as_bytes(ba.beast_specs["level"]),
-                "special1": check_exists_int(ba.beast_specs["specials"]["special1"]),
-                "special2": check_exists_int(ba.beast_specs["specials"]["special2"]),
-                "special3": check_exists_int(ba.beast_specs["specials"]["special3"]),
-                "seed": encode_int_as_bytes(ba.seed),
-                "adventurerId": check_exists_int(ba.adventurer_state["adventurer_id"]),
-                "adventurerHealth": encode_int_as_bytes(
-                    ba.adventurer_state["adventurer"]["health"]
-                ),
-                "attacker": check_exists_int(1),
-                "fled": check_exists_int(0),
-                "damageDealt": encode_int_as_bytes(ba.damage),
-                "criticalHit": ba.critical_hit,
-                "damageTaken": encode_int_as_bytes(0),
-                "damageLocation": check_exists_int(ba.location),
-                "xpEarnedAdventurer": encode_int_as_bytes(0),
-                "xpEarnedItems": encode_int_as_bytes(0),
-                "goldEarned": encode_int_as_bytes(0),
-                "discoveryTime": beast_document["discoveryTime"],
-                "blockTime": block_time,
-                "timestamp": datetime.now(),
-            }
-            await info.storage.insert_one("battles", attacked_beast_doc)
-            print(
-                "- [attack beast]",
-                ba.id,
-                "->",
-                ba.adventurer_state["adventurer_id"],
-            )
-        except StopIteration:
-            print("No documents found in beast_discovery")
+        discovery_time = await self.get_discovery_time(
+            info, ba.id, ba.adventurer_state["adventurer_id"], ba.seed
+        )
+        if discovery_time is None:
+            logger.warning("No documents found in beast_discovery")
+            return
+        attacked_beast_doc = {
+            "txHash": encode_hex_as_bytes(tx_hash),
+            "beast": check_exists_int(ba.id),
+            "beastHealth": encode_int_as_bytes(
+                ba.adventurer_state["adventurer"]["beast_health"]
+            ),
+            "beastLevel": encode_int_as_bytes(ba.beast_specs["level"]),
+            "special1": check_exists_int(ba.beast_specs["specials"]["special1"]),
+            "special2": check_exists_int(ba.beast_specs["specials"]["special2"]),
+            "special3": check_exists_int(ba.beast_specs["specials"]["special3"]),
+            "seed": encode_int_as_bytes(ba.seed),
+            "adventurerId": check_exists_int(ba.adventurer_state["adventurer_id"]),
+            "adventurerHealth": encode_int_as_bytes(
+                ba.adventurer_state["adventurer"]["health"]
+            ),
+            "attacker": check_exists_int(1),
+            "fled": check_exists_int(0),
+            "damageDealt": encode_int_as_bytes(ba.damage),
+            "criticalHit": ba.critical_hit,
+            "damageTaken": encode_int_as_bytes(0),
+            "damageLocation": check_exists_int(ba.location),
+            "xpEarnedAdventurer": encode_int_as_bytes(0),
+            "xpEarnedItems": encode_int_as_bytes(0),
+            "goldEarned": encode_int_as_bytes(0),
+            "discoveryTime": discovery_time,
+            "blockTime": block_time,
+            "timestamp": datetime.now(),
+        }
+        await info.storage.insert_one("battles", attacked_beast_doc)
+        logger.info(
+            "attack beast %s -> %s", ba.id, ba.adventurer_state["adventurer_id"]
+        )
 
     async def attacked_by_beast(
         self,
@@ -1013,61 +1163,49 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        abb,
     ):
-        abb = decode_attacked_by_beast_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, abb.adventurer_state, block_time)
-        try:
-            beast_discovery = await info.storage.find(
-                "discoveries",
-                {
-                    "entity": check_exists_int(abb.id),
-                    "adventurerId": check_exists_int(
-                        abb.adventurer_state["adventurer_id"]
-                    ),
-                    "seed": encode_int_as_bytes(abb.seed),
-                },
-                sort={"discoveryTime": -1},
-                limit=1,
-            )
-            beast_document = next(beast_discovery)
-            attacked_by_beast_doc = {
-                "txHash": encode_hex_as_bytes(tx_hash),
-                "beast": check_exists_int(abb.id),
-                "beastHealth": encode_int_as_bytes(
-                    abb.adventurer_state["adventurer"]["beast_health"]
-                ),
-                "beastLevel": encode_int_as_bytes(abb.beast_specs["level"]),
-                "special1": check_exists_int(abb.beast_specs["specials"]["special1"]),
-                "special2": check_exists_int(abb.beast_specs["specials"]["special2"]),
-                "special3": check_exists_int(abb.beast_specs["specials"]["special3"]),
-                "seed": encode_int_as_bytes(abb.seed),
-                "adventurerId": check_exists_int(abb.adventurer_state["adventurer_id"]),
-                "adventurerHealth": encode_int_as_bytes(
-                    abb.adventurer_state["adventurer"]["health"]
-                ),
-                "attacker": check_exists_int(2),
-                "fled": check_exists_int(0),
-                "damageDealt": encode_int_as_bytes(0),
-                "criticalHit": abb.critical_hit,
-                "damageTaken": encode_int_as_bytes(abb.damage),
-                "damageLocation": check_exists_int(abb.location),
-                "xpEarnedAdventurer": encode_int_as_bytes(0),
-                "xpEarnedItems": encode_int_as_bytes(0),
-                "goldEarned": encode_int_as_bytes(0),
-                "discoveryTime": beast_document["discoveryTime"],
-                "blockTime": block_time,
-                "timestamp": datetime.now(),
-            }
-            await info.storage.insert_one("battles", attacked_by_beast_doc)
-            print(
-                "- [attacked by beast]",
-                abb.id,
-                "->",
-                abb.adventurer_state["adventurer_id"],
-            )
-        except StopIteration:
-            print("No documents found in beast_discovery")
+        await update_adventurer_helper(
+            info, abb.adventurer_state, block_time, self.adventurer_cache
+        )
+        discovery_time = await self.get_discovery_time(
+            info, abb.id, abb.adventurer_state["adventurer_id"], abb.seed
+        )
+        if discovery_time is None:
+            logger.warning("No documents found in beast_discovery")
+            return
+        attacked_by_beast_doc = {
+            "txHash": encode_hex_as_bytes(tx_hash),
+            "beast": check_exists_int(abb.id),
+            "beastHealth": encode_int_as_bytes(
+                abb.adventurer_state["adventurer"]["beast_health"]
+            ),
+            "beastLevel": encode_int_as_bytes(abb.beast_specs["level"]),
+            "special1": check_exists_int(abb.beast_specs["specials"]["special1"]),
+            "special2": check_exists_int(abb.beast_specs["specials"]["special2"]),
+            "special3": check_exists_int(abb.beast_specs["specials"]["special3"]),
+            "seed": encode_int_as_bytes(abb.seed),
+            "adventurerId": check_exists_int(abb.adventurer_state["adventurer_id"]),
+            "adventurerHealth": encode_int_as_bytes(
+                abb.adventurer_state["adventurer"]["health"]
+            ),
+            "attacker": check_exists_int(2),
+            "fled": check_exists_int(0),
+            "damageDealt": encode_int_as_bytes(0),
+            "criticalHit": abb.critical_hit,
+            "damageTaken": encode_int_as_bytes(abb.damage),
+            "damageLocation": check_exists_int(abb.location),
+            "xpEarnedAdventurer": encode_int_as_bytes(0),
+            "xpEarnedItems": encode_int_as_bytes(0),
+            "goldEarned": encode_int_as_bytes(0),
+            "discoveryTime": discovery_time,
+            "blockTime": block_time,
+            "timestamp": datetime.now(),
+        }
+        await info.storage.insert_one("battles", attacked_by_beast_doc)
+        logger.info(
+            "attacked by beast %s -> %s", abb.id, abb.adventurer_state["adventurer_id"]
+        )
 
     async def slayed_beast(
         self,
@@ -1075,10 +1213,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        sb,
     ):
-        sb = decode_slayed_beast_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, sb.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, sb.adventurer_state, block_time, self.adventurer_cache
+        )
         await update_beast_health(
             info,
             sb.id,
@@ -1088,62 +1227,49 @@ class LootSurvivorIndexer(StarkNetIndexer):
             True,
             block_time,
         )
-        try:
-            beast_discovery = await info.storage.find(
-                "discoveries",
-                {
-                    "entity": check_exists_int(sb.id),
-                    "adventurerId": check_exists_int(
-                        sb.adventurer_state["adventurer_id"]
-                    ),
-                    "seed": encode_int_as_bytes(sb.seed),
-                },
-                sort={"discoveryTime": -1},
-                limit=1,
-            )
-            beast_document = next(beast_discovery)
-            slayed_beast_doc = {
-                "txHash": encode_hex_as_bytes(tx_hash),
-                "beast": check_exists_int(sb.id),
-                "beastHealth": encode_int_as_bytes(
-                    sb.adventurer_state["adventurer"]["beast_health"]
-                ),
-                "beastLevel": encode_int_as_bytes(sb.beast_specs["level"]),
-                "special1": check_exists_int(sb.beast_specs["specials"]["special1"]),
-                "special2": check_exists_int(sb.beast_specs["specials"]["special2"]),
-                "special3": check_exists_int(sb.beast_specs["specials"]["special3"]),
-                "seed": encode_int_as_bytes(sb.seed),
-                "adventurerId": check_exists_int(sb.adventurer_state["adventurer_id"]),
-                "adventurerHealth": encode_int_as_bytes(
-                    sb.adventurer_state["adventurer"]["health"]
-                ),
-                "attacker": check_exists_int(1),
-                "fled": check_exists_int(0),
-                "damageDealt": encode_int_as_bytes(sb.damage_dealt),
-                "criticalHit": sb.critical_hit,
-                "damageTaken": encode_int_as_bytes(0),
-                "damageLocation": check_exists_int(0),
-                "xpEarnedAdventurer": encode_int_as_bytes(sb.xp_earned_adventurer),
-                "xpEarnedItems": encode_int_as_bytes(sb.xp_earned_items),
-                "goldEarned": encode_int_as_bytes(sb.gold_earned),
-                "discoveryTime": beast_document["discoveryTime"],
-                "blockTime": block_time,
-                "timestamp": datetime.now(),
-            }
-            await info.storage.insert_one("battles", slayed_beast_doc)
-            await update_items_xp(
-                info,
-                sb.adventurer_state["adventurer_id"],
-                sb.adventurer_state["adventurer"],
-            )
-            print(
-                "- [slayed beast]",
-                sb.id,
-                "->",
-                sb.adventurer_state["adventurer_id"],
-            )
-        except StopIteration:
-            print("No documents found in beast_discovery")
+        discovery_time = await self.get_discovery_time(
+            info, sb.id, sb.adventurer_state["adventurer_id"], sb.seed
+        )
+        if discovery_time is None:
+            logger.warning("No documents found in beast_discovery")
+            return
+        slayed_beast_doc = {
+            "txHash": encode_hex_as_bytes(tx_hash),
+            "beast": check_exists_int(sb.id),
+            "beastHealth": encode_int_as_bytes(
+                sb.adventurer_state["adventurer"]["beast_health"]
+            ),
+            "beastLevel": encode_int_as_bytes(sb.beast_specs["level"]),
+            "special1": check_exists_int(sb.beast_specs["specials"]["special1"]),
+            "special2": check_exists_int(sb.beast_specs["specials"]["special2"]),
+            "special3": check_exists_int(sb.beast_specs["specials"]["special3"]),
+            "seed": encode_int_as_bytes(sb.seed),
+            "adventurerId": check_exists_int(sb.adventurer_state["adventurer_id"]),
+            "adventurerHealth": encode_int_as_bytes(
+                sb.adventurer_state["adventurer"]["health"]
+            ),
+            "attacker": check_exists_int(1),
+            "fled": check_exists_int(0),
+            "damageDealt": encode_int_as_bytes(sb.damage_dealt),
+            "criticalHit": sb.critical_hit,
+            "damageTaken": encode_int_as_bytes(0),
+            "damageLocation": check_exists_int(0),
+            "xpEarnedAdventurer": encode_int_as_bytes(sb.xp_earned_adventurer),
+            "xpEarnedItems": encode_int_as_bytes(sb.xp_earned_items),
+            "goldEarned": encode_int_as_bytes(sb.gold_earned),
+            "discoveryTime": discovery_time,
+            "blockTime": block_time,
+            "timestamp": datetime.now(),
+        }
+        await info.storage.insert_one("battles", slayed_beast_doc)
+        await update_items_xp(
+            info,
+            sb.adventurer_state["adventurer_id"],
+            sb.adventurer_state["adventurer"],
+        )
+        logger.info(
+            "slayed beast %s -> %s", sb.id, sb.adventurer_state["adventurer_id"]
+        )
 
     async def flee_failed(
         self,
@@ -1151,61 +1277,47 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        fa,
     ):
-        fa = decode_flee_failed_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, fa.adventurer_state, block_time)
-        try:
-            beast_discovery = await info.storage.find(
-                "discoveries",
-                {
-                    "entity": check_exists_int(fa.id),
-                    "adventurerId": check_exists_int(
-                        fa.adventurer_state["adventurer_id"]
-                    ),
-                    "seed": encode_int_as_bytes(fa.seed),
-                },
-                sort={"discoveryTime": -1},
-                limit=1,
-            )
-            beast_document = next(beast_discovery)
-            flee_attempt_doc = {
-                "txHash": encode_hex_as_bytes(tx_hash),
-                "beast": check_exists_int(fa.id),
-                "beastHealth": encode_int_as_bytes(
-                    fa.adventurer_state["adventurer"]["beast_health"]
-                ),
-                "beastLevel": encode_int_as_bytes(fa.beast_specs["level"]),
-                "special1": check_exists_int(fa.beast_specs["specials"]["special1"]),
-                "special2": check_exists_int(fa.beast_specs["specials"]["special2"]),
-                "special3": check_exists_int(fa.beast_specs["specials"]["special3"]),
-                "seed": encode_int_as_bytes(fa.seed),
-                "adventurerId": check_exists_int(fa.adventurer_state["adventurer_id"]),
-                "adventurerHealth": encode_int_as_bytes(
-                    fa.adventurer_state["adventurer"]["health"]
-                ),
-                "attacker": check_exists_int(1),
-                "fled": check_exists_int(0),
-                "damageDealt": encode_int_as_bytes(0),
-                "criticalHit": False,
-                "damageTaken": encode_int_as_bytes(0),
-                "damageLocation": check_exists_int(0),
-                "xpEarnedAdventurer": encode_int_as_bytes(0),
-                "xpEarnedItems": encode_int_as_bytes(0),
-                "goldEarned": encode_int_as_bytes(0),
-                "discoveryTime": beast_document["discoveryTime"],
-                "blockTime": block_time,
-                "timestamp": datetime.now(),
-            }
-            await info.storage.insert_one("battles", flee_attempt_doc)
-            print(
-                "- [flee failed]",
-                fa.id,
-                "->",
-                fa.adventurer_state["adventurer_id"],
-            )
-        except StopIteration:
-            print("No documents found in beast_discovery")
+        await update_adventurer_helper(
+            info, fa.adventurer_state, block_time, self.adventurer_cache
+        )
+        discovery_time = await self.get_discovery_time(
+            info, fa.id, fa.adventurer_state["adventurer_id"], fa.seed
+        )
+        if discovery_time is None:
+            logger.warning("No documents found in beast_discovery")
+            return
+        flee_attempt_doc = {
+            "txHash": encode_hex_as_bytes(tx_hash),
+            "beast": check_exists_int(fa.id),
+            "beastHealth": encode_int_as_bytes(
+                fa.adventurer_state["adventurer"]["beast_health"]
+            ),
+            "beastLevel": encode_int_as_bytes(fa.beast_specs["level"]),
+            "special1": check_exists_int(fa.beast_specs["specials"]["special1"]),
+            "special2": check_exists_int(fa.beast_specs["specials"]["special2"]),
+            "special3": check_exists_int(fa.beast_specs["specials"]["special3"]),
+            "seed": encode_int_as_bytes(fa.seed),
+            "adventurerId": check_exists_int(fa.adventurer_state["adventurer_id"]),
+            "adventurerHealth": encode_int_as_bytes(
+                fa.adventurer_state["adventurer"]["health"]
+            ),
+            "attacker": check_exists_int(1),
+            "fled": check_exists_int(0),
+            "damageDealt": encode_int_as_bytes(0),
+            "criticalHit": False,
+            "damageTaken": encode_int_as_bytes(0),
+            "damageLocation": check_exists_int(0),
+            "xpEarnedAdventurer": encode_int_as_bytes(0),
+            "xpEarnedItems": encode_int_as_bytes(0),
+            "goldEarned": encode_int_as_bytes(0),
+            "discoveryTime": discovery_time,
+            "blockTime": block_time,
+            "timestamp": datetime.now(),
+        }
+        await info.storage.insert_one("battles", flee_attempt_doc)
+        logger.info("flee failed %s -> %s", fa.id, fa.adventurer_state["adventurer_id"])
 
     async def flee_succeeded(
         self,
@@ -1213,61 +1325,49 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        fa,
     ):
-        fa = decode_flee_succeeded_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, fa.adventurer_state, block_time)
-        try:
-            beast_discovery = await info.storage.find(
-                "discoveries",
-                {
-                    "entity": check_exists_int(fa.id),
-                    "adventurerId": check_exists_int(
-                        fa.adventurer_state["adventurer_id"]
-                    ),
-                    "seed": encode_int_as_bytes(fa.seed),
-                },
-                sort={"discoveryTime": -1},
-                limit=1,
-            )
-            beast_document = next(beast_discovery)
-            flee_attempt_doc = {
-                "txHash": encode_hex_as_bytes(tx_hash),
-                "beast": check_exists_int(fa.id),
-                "beastHealth": encode_int_as_bytes(
-                    fa.adventurer_state["adventurer"]["beast_health"]
-                ),
-                "beastLevel": encode_int_as_bytes(fa.beast_specs["level"]),
-                "special1": check_exists_int(fa.beast_specs["specials"]["special1"]),
-                "special2": check_exists_int(fa.beast_specs["specials"]["special2"]),
-                "special3": check_exists_int(fa.beast_specs["specials"]["special3"]),
-                "seed": encode_int_as_bytes(fa.seed),
-                "adventurerId": check_exists_int(fa.adventurer_state["adventurer_id"]),
-                "adventurerHealth": encode_int_as_bytes(
-                    fa.adventurer_state["adventurer"]["health"]
-                ),
-                "attacker": check_exists_int(1),
-                "fled": check_exists_int(1),
-                "damageDealt": encode_int_as_bytes(0),
-                "criticalHit": False,
-                "damageTaken": encode_int_as_bytes(0),
-                "damageLocation": check_exists_int(0),
-                "xpEarnedAdventurer": encode_int_as_bytes(0),
-                "xpEarnedItems": encode_int_as_bytes(0),
-                "goldEarned": encode_int_as_bytes(0),
-                "discoveryTime": beast_document["discoveryTime"],
-                "blockTime": block_time,
-                "timestamp": datetime.now(),
-            }
-            await info.storage.insert_one("battles", flee_attempt_doc)
-            print(
-                "- [flee succeeded]",
-                fa.id,
-                "->",
-                fa.adventurer_state["adventurer_id"],
-            )
-        except StopIteration:
-            print("No documents found in beast_discovery")
+        await update_adventurer_helper(
+            info, fa.adventurer_state, block_time, self.adventurer_cache
+        )
+        discovery_time = await self.get_discovery_time(
+            info, fa.id, fa.adventurer_state["adventurer_id"], fa.seed
+        )
+        if discovery_time is None:
+            logger.warning("No documents found in beast_discovery")
+            return
+        flee_attempt_doc = {
+            "txHash": encode_hex_as_bytes(tx_hash),
+            "beast": check_exists_int(fa.id),
+            "beastHealth": encode_int_as_bytes(
+                fa.adventurer_state["adventurer"]["beast_health"]
+            ),
+            "beastLevel": encode_int_as_bytes(fa.beast_specs["level"]),
+            "special1": check_exists_int(fa.beast_specs["specials"]["special1"]),
+            "special2": check_exists_int(fa.beast_specs["specials"]["special2"]),
+            "special3": check_exists_int(fa.beast_specs["specials"]["special3"]),
+            "seed": encode_int_as_bytes(fa.seed),
+            "adventurerId": check_exists_int(fa.adventurer_state["adventurer_id"]),
+            "adventurerHealth": encode_int_as_bytes(
+                fa.adventurer_state["adventurer"]["health"]
+            ),
+            "attacker": check_exists_int(1),
+            "fled": check_exists_int(1),
+            "damageDealt": encode_int_as_bytes(0),
+            "criticalHit": False,
+            "damageTaken": encode_int_as_bytes(0),
+            "damageLocation": check_exists_int(0),
+            "xpEarnedAdventurer": encode_int_as_bytes(0),
+            "xpEarnedItems": encode_int_as_bytes(0),
+            "goldEarned": encode_int_as_bytes(0),
+            "discoveryTime": discovery_time,
+            "blockTime": block_time,
+            "timestamp": datetime.now(),
+        }
+        await info.storage.insert_one("battles", flee_attempt_doc)
+        logger.info(
+            "flee succeeded %s -> %s", fa.id, fa.adventurer_state["adventurer_id"]
+        )
 
     async def purchased_item(
         self,
@@ -1275,77 +1375,55 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        pi,
     ):
-        pi = decode_purchased_item_event.deserialize([felt.to_int(i) for i in data])
+        adventurer_id = pi.adventurer_state_with_bag["adventurer_state"][
+            "adventurer_id"
+        ]
+        # Everything of the offer is known from the event, the item is written
+        # without reading the offer first
         purchased_item_doc = {
+            "item": check_exists_int(pi.item_id),
+            "adventurerId": check_exists_int(adventurer_id),
             "owner": True,
             "equipped": True if pi.equipped else False,
             "ownerAddress": check_exists_int(
                 pi.adventurer_state_with_bag["adventurer_state"]["owner"]
             ),
+            "xp": encode_int_as_bytes(0),
             "cost": encode_int_as_bytes(pi.cost),
+            "special1": check_exists_int(0),
+            "special2": check_exists_int(0),
+            "special3": check_exists_int(0),
+            "createdTime": datetime.now(),
             "purchasedTime": block_time,
             "lastUpdatedTime": block_time,
             "timestamp": datetime.now(),
         }
-        # Get the most recently created item so it can be updated
-        try:
-            item = await info.storage.find(
-                "items",
-                {
-                    "item": check_exists_int(
-                        pi.item_id,
-                    ),
-                    "adventurerId": check_exists_int(
-                        pi.adventurer_state_with_bag["adventurer_state"][
-                            "adventurer_id"
-                        ]
-                    ),
-                },
-                sort={"createdTime": -1},
-                limit=1,
-            )
-            item_document = next(item)
-            await info.storage.find_one_and_update(
-                "items",
-                {
-                    "item": check_exists_int(pi.item_id),
-                    "adventurerId": check_exists_int(
-                        pi.adventurer_state_with_bag["adventurer_state"][
-                            "adventurer_id"
-                        ]
-                    ),
-                    "lastUpdatedTime": item_document["lastUpdatedTime"],
-                },
-                {"$set": purchased_item_doc},
-            )
-            await update_adventurer_helper(
-                info, pi.adventurer_state_with_bag["adventurer_state"], block_time
-            )
-            await update_adventurer_bag(
-                info,
-                pi.adventurer_state_with_bag["adventurer_state"]["adventurer_id"],
-                pi.adventurer_state_with_bag["bag"],
-            )
-            if pi.equipped:
-                await swap_item(
-                    info,
-                    pi.adventurer_state_with_bag["adventurer_state"]["adventurer_id"],
-                    pi.item_id,
-                    pi.unequipped_item_id,
-                    block_time,
-                )
-            print(
-                "- [purchased item]",
-                pi.adventurer_state_with_bag["adventurer_state"]["adventurer_id"],
-                "->",
-                pi.item_id,
-                "->",
-                pi.cost,
+        await info.storage.insert_one("items", purchased_item_doc)
+        # The offer stays in the market as purchased
+        await info.storage.update_one(
+            "market_items",
+            {
+                "item": check_exists_int(pi.item_id),
+                "adventurerId": check_exists_int(adventurer_id),
+            },
+            {"$set": {"owner": True}},
+        )
+        await update_adventurer_helper(
+            info,
+            pi.adventurer_state_with_bag["adventurer_state"],
+            block_time,
+            self.adventurer_cache,
+        )
+        await update_adventurer_bag(
+            info, adventurer_id, pi.adventurer_state_with_bag["bag"]
+        )
+        if pi.equipped:
+            await swap_item(
+                info, adventurer_id, pi.item_id, pi.unequipped_item_id, block_time
             )
-        except StopIteration:
-            print("No documents found in item")
+        logger.info("purchased item %s -> %s -> %s", adventurer_id, pi.item_id, pi.cost)
 
     async def equipped_item(
         self,
@@ -1353,11 +1431,13 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        ei,
     ):
-        ei = decode_equipped_item_event.deserialize([felt.to_int(i) for i in data])
         await update_adventurer_helper(
-            info, ei.adventurer_state_with_bag["adventurer_state"], block_time
+            info,
+            ei.adventurer_state_with_bag["adventurer_state"],
+            block_time,
+            self.adventurer_cache,
         )
         await swap_item(
             info,
@@ -1366,7 +1446,9 @@ class LootSurvivorIndexer(StarkNetIndexer):
             ei.unequipped_item_id,
             block_time,
         )
-        print("- [equipped item]", ei.equipped_item_id, "->", ei.unequipped_item_id)
+        logger.info(
+            "equipped item %s -> %s", ei.equipped_item_id, ei.unequipped_item_id
+        )
 
     async def dropped_item(
         self,
@@ -1374,21 +1456,20 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        di,
     ):
-        di = decode_dropped_item_event.deserialize([felt.to_int(i) for i in data])
         await update_adventurer_helper(
-            info, di.adventurer_state_with_bag["adventurer_state"], block_time
+            info,
+            di.adventurer_state_with_bag["adventurer_state"],
+            block_time,
+            self.adventurer_cache,
         )
         await info.storage.find_one_and_update(
             "items",
-            {
-                "item": check_exists_int(di.item_id),
-                "adventurerId": check_exists_int(
-                    di.adventurer_state_with_bag["adventurer_state"]["adventurer_id"],
-                ),
-                "owner": True,
-            },
+            item_key(
+                di.adventurer_state_with_bag["adventurer_state"]["adventurer_id"],
+                di.item_id,
+            ),
             {
                 "$set": {
                     "equipped": False,
@@ -1398,10 +1479,9 @@ class LootSurvivorIndexer(StarkNetIndexer):
                 },
             },
         )
-        print(
-            "- [dropped item]",
+        logger.info(
+            "dropped item %s -> %s",
             di.adventurer_state_with_bag["adventurer_state"]["adventurer_id"],
-            "->",
             di.item_id,
         )
 
@@ -1411,16 +1491,14 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        gi,
     ):
-        gi = decode_greatness_increased_event.deserialize(
-            [felt.to_int(i) for i in data]
+        await update_adventurer_helper(
+            info, gi.adventurer_state, block_time, self.adventurer_cache
         )
-        await update_adventurer_helper(info, gi.adventurer_state, block_time)
-        print(
-            "- [greatness increased]",
+        logger.info(
+            "greatness increased %s -> %s",
             gi.adventurer_state["adventurer_id"],
-            "->",
             gi.item_id,
         )
 
@@ -1430,12 +1508,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        isu,
     ):
-        isu = decode_item_special_unlocked_event.deserialize(
-            [felt.to_int(i) for i in data]
+        await update_adventurer_helper(
+            info, isu.adventurer_state, block_time, self.adventurer_cache
         )
-        await update_adventurer_helper(info, isu.adventurer_state, block_time)
         item_special_doc = {
             "special1": check_exists_int(isu.specials["special1"]),
             "special2": check_exists_int(isu.specials["special2"]),
@@ -1444,17 +1521,12 @@ class LootSurvivorIndexer(StarkNetIndexer):
         }
         await info.storage.find_one_and_update(
             "items",
-            {
-                "item": check_exists_int(isu.id),
-                "adventurerId": check_exists_int(isu.adventurer_state["adventurer_id"]),
-                "owner": True,
-            },
+            item_key(isu.adventurer_state["adventurer_id"], isu.id),
             {"$set": item_special_doc},
         )
-        print(
-            "- [item special unlocked]",
+        logger.info(
+            "item special unlocked %s -> %s",
             isu.adventurer_state["adventurer_id"],
-            "->",
             isu.id,
         )
 
@@ -1464,10 +1536,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        pp,
     ):
-        pp = decode_purchased_potion_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, pp.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, pp.adventurer_state, block_time, self.adventurer_cache
+        )
         purchase_doc = {
             "txHash": tx_hash,
             "adventurerId": check_exists_int(pp.adventurer_state["adventurer_id"]),
@@ -1477,10 +1550,9 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("health_purchases", purchase_doc)
-        print(
-            "- [purchased potion]",
+        logger.info(
+            "purchased potion %s -> %s",
             pp.adventurer_state["adventurer_id"],
-            "->",
             pp.health_amount,
         )
 
@@ -1490,9 +1562,8 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        hs,
     ):
-        hs = decode_new_high_score_event.deserialize([felt.to_int(i) for i in data])
         new_high_score_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
             "adventurerId": encode_int_as_bytes(hs.adventurer_state["adventurer_id"]),
@@ -1503,7 +1574,7 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("scores", new_high_score_doc)
-        print("- [new high score]", hs.adventurer_state["adventurer_id"])
+        logger.info("new high score %s", hs.adventurer_state["adventurer_id"])
 
     async def adventurer_died(
         self,
@@ -1511,10 +1582,11 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        ad,
     ):
-        ad = decode_adventurer_died_event.deserialize([felt.to_int(i) for i in data])
-        await update_adventurer_helper(info, ad.adventurer_state, block_time)
+        await update_adventurer_helper(
+            info, ad.adventurer_state, block_time, self.adventurer_cache
+        )
         adventurer_died_doc = {
             "txHash": encode_hex_as_bytes(tx_hash),
             "adventurerId": encode_int_as_bytes(ad.adventurer_state["adventurer_id"]),
@@ -1524,11 +1596,7 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "timestamp": datetime.now(),
         }
         await info.storage.insert_one("deaths", adventurer_died_doc)
-        print(
-            "- [adventurer died]",
-            ad.adventurer_state["adventurer_id"],
-            "->",
-        )
+        logger.info("adventurer died %s", ad.adventurer_state["adventurer_id"])
 
     async def adventurer_leveled_up(
         self,
@@ -1536,16 +1604,14 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        alu,
     ):
-        alu = decode_adventurer_leveled_up_event.deserialize(
-            [felt.to_int(i) for i in data]
+        await update_adventurer_helper(
+            info, alu.adventurer_state, block_time, self.adventurer_cache
         )
-        await update_adventurer_helper(info, alu.adventurer_state, block_time)
-        print(
-            "- [adventurer leveled up]",
+        logger.info(
+            "adventurer leveled up %s -> %s",
             alu.adventurer_state["adventurer_id"],
-            "->",
             alu.new_level,
         )
 
@@ -1555,47 +1621,50 @@ class LootSurvivorIndexer(StarkNetIndexer):
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        sa,
     ):
-        sa = decode_new_items_available_event.deserialize(
-            [felt.to_int(i) for i in data]
-        )
-        for item in sa.items:
-            items_doc = {
-                "item": check_exists_int(item["item"]["id"]),
-                "adventurerId": check_exists_int(sa.adventurer_state["adventurer_id"]),
-                "owner": False,
-                "equipped": False,
-                "ownerAddress": check_exists_int(0),
-                "xp": encode_int_as_bytes(0),
-                "cost": encode_int_as_bytes(item["price"]),
-                "special1": check_exists_int(0),
-                "special2": check_exists_int(0),
-                "special3": check_exists_int(0),
-                "createdTime": datetime.now(),
-                "purchasedTime": check_exists_int(0),
-                "lastUpdatedTime": block_time,
-                "timestamp": datetime.now(),
-            }
-            await info.storage.insert_one("items", items_doc)
-
-        print(
-            "- [new items available]",
-            sa.adventurer_state["adventurer_id"],
+        adventurer_id = check_exists_int(sa.adventurer_state["adventurer_id"])
+        # The new offers replace the previous ones of the adventurer, the
+        # replaced ones are deleted later, see `prune_market_items`
+        await info.storage.delete_many("market_items", {"adventurerId": adventurer_id})
+        await info.storage.insert_many(
+            "market_items",
+            [
+                {
+                    "item": check_exists_int(item["item"]["id"]),
+                    "adventurerId": adventurer_id,
+                    "owner": False,
+                    "equipped": False,
+                    "ownerAddress": check_exists_int(0),
+                    "xp": encode_int_as_bytes(0),
+                    "cost": encode_int_as_bytes(item["price"]),
+                    "special1": check_exists_int(0),
+                    "special2": check_exists_int(0),
+                    "special3": check_exists_int(0),
+                    "createdTime": datetime.now(),
+                    "purchasedTime": check_exists_int(0),
+                    "lastUpdatedTime": block_time,
+                    "timestamp": datetime.now(),
+                    # Block of the offers, the latest generation is the current one
+                    "generation": info.storage.block_number,
+                }
+                for item in sa.items
+            ],
         )
 
+        logger.info("new items available %s", sa.adventurer_state["adventurer_id"])
+
     async def idle_damage_penalty(
         self,
         info: Info,
         block_time: datetime,
         _: FieldElement,
         tx_hash: str,
-        data: List[FieldElement],
+        idp,
     ):
-        idp = decode_idle_damage_penalty_event.deserialize(
-            [felt.to_int(i) for i in data]
+        await update_adventurer_helper(
+            info, idp.adventurer_state, block_time, self.adventurer_cache
         )
-        await update_adventurer_helper(info, idp.adventurer_state, block_time)
         if idp.adventurer_state["adventurer"]["beast_health"] > 0:
             penalty_battle_doc = {
                 "txHash": encode_hex_as_bytes(tx_hash),
@@ -1653,15 +1722,30 @@ class LootSurvivorIndexer(StarkNetIndexer):
                 "timestamp": datetime.now(),
             }
             await info.storage.insert_one("discoveries", penalty_discovery_doc)
-        print(
-            "- [idle damage penalty]",
+        logger.info(
+            "idle damage penalty %s -> %s",
             idp.adventurer_state["adventurer_id"],
-            "->",
             idp.adventurer_state["adventurer"]["health"],
         )
 
-    async def handle_invalidate(self, _info: Info, _cursor: Cursor):
-        raise ValueError("data must be finalized")
+    async def handle_invalidate(self, _info: Info, cursor: Cursor):
+        # The runner has already rolled back the documents written after
+        # `cursor`, using their `_chain.valid_from` and `_chain.valid_to`.
+        # The cached documents may be from the dropped blocks.
+        logger.warning("Invalidating blocks after %s", cursor.order_key)
+        await self.clear_caches()
+        if self.snapshots is not None:
+            self.snapshots.invalidate(cursor)
+
+
+class LootSurvivorRunner(IndexerRunner):
+    def _setup_storage(self, indexer: LootSurvivorIndexer):
+        # Let the indexer skip the already applied events of the pending block
+        self._indexer_id = indexer.indexer_id()
+        self._indexer_storage = PendingBlockStorage(
+            self._config.storage_url, self._indexer_id
+        )
+        indexer.pending_storage = self._indexer_storage
 
 
 async def run_indexer(
@@ -1672,11 +1756,33 @@ async def run_indexer(
     network=None,
     game=None,
     start_block=None,
+    compact_storage=False,
+    record=None,
+    shards=0,
+    metrics_port=None,
+    log_level="INFO",
+    log_sample=(),
+    snapshot_dir=None,
+    snapshot_interval=10_000,
+    from_snapshot=False,
+    handler_concurrency=16,
+    journal=False,
 ):
+    configure_logging(log_level, log_sample)
+    config = Config(
+        network, game, start_block, compact_storage, handler_concurrency, journal
+    )
+    snapshots = create_snapshots(
+        config, mongo_url, snapshot_dir, snapshot_interval, from_snapshot
+    )
+    if from_snapshot:
+        # The runner must resume from the restored data
+        restart = False
+
     AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
     if server_url == "localhost:7171" or server_url == "apibara:7171":
         stream_ssl = False
-    runner = IndexerRunner(
+    runner = LootSurvivorRunner(
         config=IndexerRunnerConfiguration(
             stream_url=server_url,
             stream_ssl=stream_ssl,
@@ -1687,11 +1793,222 @@ async def run_indexer(
         _reconnect_to_avoid_disconnection=5,
     )
 
-    config = Config(network, game, start_block)
-
     # ctx can be accessed by the callbacks in `info`.
     if server_url == "localhost:7171" or server_url == "apibara:7171":
         ctx = {"network": "starknet-goerli"}
     else:
         ctx = {"network": "starknet-goerli"}
-    await runner.run(LootSurvivorIndexer(config), ctx=ctx)
+
+    recorder = BlockRecorder(record) if record is not None else None
+    shard_pool = create_shard_pool(config, mongo_url, shards, (log_level, log_sample))
+    if metrics_port is not None:
+        await metrics.start_metrics_server(metrics_port)
+    try:
+        await runner.run(
+            LootSurvivorIndexer(config, recorder, shard_pool, snapshots), ctx=ctx
+        )
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if shard_pool is not None:
+            shard_pool.close()
+        if snapshots is not None:
+            snapshots.close()
+        stop_logging()
+
+
+def create_shard_pool(config, mongo_url, shards, log_options):
+    if shards <= 1:
+        return None
+    db_name = f"mongo-{config.network}".replace("-", "_")
+    return ShardPool(config, mongo_url, db_name, shards, log_options)
+
+
+def create_snapshots(config, mongo_url, snapshot_dir, interval, from_snapshot):
+    """Return the snapshots of the network database, after restoring the
+    latest one into the database if `from_snapshot`."""
+    if snapshot_dir is None:
+        if from_snapshot:
+            raise ValueError("--from-snapshot requires --snapshot-dir")
+        return None
+    indexer_id = f"mongo-{config.network}"
+    snapshots = Snapshots(
+        os.path.join(snapshot_dir, indexer_id.replace("-", "_")), interval
+    )
+    if from_snapshot:
+        storage = IndexerStorage(mongo_url, indexer_id)
+        if snapshots.restore_latest(storage.db, indexer_id) is None:
+            raise ValueError(f"No snapshot found in {snapshots.directory}")
+    return snapshots
+
+
+async def replay_indexer(
+    path,
+    mongo_url=None,
+    restart=None,
+    network=None,
+    game=None,
+    start_block=None,
+    compact_storage=False,
+    shards=0,
+    metrics_port=None,
+    log_level="INFO",
+    log_sample=(),
+    snapshot_dir=None,
+    snapshot_interval=10_000,
+    from_snapshot=False,
+    handler_concurrency=16,
+    journal=False,
+):
+    """Index the blocks of the archive at `path`, as recorded by
+    `indexer record`, without connecting to the stream.
+
+    The indexer cursor is updated like in a live run, so `indexer start` resumes
+    after the last replayed block.
+    """
+    configure_logging(log_level, log_sample)
+    config = Config(
+        network, game, start_block, compact_storage, handler_concurrency, journal
+    )
+    snapshots = create_snapshots(
+        config, mongo_url, snapshot_dir, snapshot_interval, from_snapshot
+    )
+    shard_pool = create_shard_pool(config, mongo_url, shards, (log_level, log_sample))
+    indexer = LootSurvivorIndexer(config, shards=shard_pool, snapshots=snapshots)
+    if metrics_port is not None:
+        await metrics.start_metrics_server(metrics_port)
+    storage = IndexerStorage(mongo_url, indexer.indexer_id())
+    if restart and not from_snapshot:
+        storage.drop_database()
+
+    configuration = indexer.initial_configuration()
+    cursor = configuration.starting_cursor
+    if storage.update_with_stored_configuration(configuration):
+        # Drop the data of pending blocks, if any
+        cursor = configuration.starting_cursor
+        storage.invalidate(cursor)
+        indexed = cursor.order_key
+    else:
+        indexed = None
+
+    ctx = {"network": "starknet-goerli"}
+    replayed = 0
+    started = time.perf_counter()
+    for block in read_blocks(path):
+        block_number = block.header.block_number
+        if replayed == 0 and indexed is not None and block_number <= indexed:
+            continue
+        if replayed > 0 and block_number <= cursor.order_key:
+            # The recording restarted after a chain reorganization, replace
+            # the blocks recorded before it
+            cursor = starknet_cursor(block_number - 1)
+            storage.invalidate(cursor)
+            await indexer.handle_invalidate(None, cursor)
+
+        block_hash = felt.to_int(block.header.block_hash).to_bytes(32, "big")
+        end_cursor = starknet_cursor(block_number, block_hash)
+        with storage.create_storage_for_data(end_cursor) as block_storage:
+            info = Info(
+                context=ctx,
+                storage=block_storage,
+                cursor=cursor,
+                end_cursor=end_cursor,
+            )
+            await indexer.handle_data(info, block)
+        cursor = end_cursor
+        replayed += 1
+
+    if shard_pool is not None:
+        shard_pool.close()
+    if snapshots is not None:
+        snapshots.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Replayed %s blocks in %.1fs (%.1f blocks/s)",
+        replayed,
+        elapsed,
+        replayed / max(elapsed, 1e-9),
+    )
+    stop_logging()
+
+
+async def rebuild_indexer(
+    mongo_url=None,
+    network=None,
+    game=None,
+    start_block=None,
+    compact_storage=False,
+    collections=(),
+    handler_concurrency=16,
+    log_level="INFO",
+    log_sample=(),
+    batch_size=10_000,
+):
+    """Regenerate `collections`, all of them if empty, from the journal written
+    with `--journal`, without connecting to the stream.
+
+    The journaled blocks are indexed into a scratch database whose collections
+    then replace the rebuilt ones. The indexer must be stopped while rebuilding,
+    and the journal must start with the first indexed block.
+    """
+    configure_logging(log_level, log_sample)
+    config = Config(network, game, start_block, compact_storage, handler_concurrency)
+    derived = [collection for collection in INDEXES if collection != JOURNAL]
+    collections = list(collections) or derived
+    unknown = set(collections) - set(derived)
+    if unknown:
+        raise ValueError(f"Cannot rebuild {', '.join(sorted(unknown))}")
+
+    indexer = LootSurvivorIndexer(config)
+    configuration = indexer.initial_configuration()
+    storage = IndexerStorage(mongo_url, indexer.indexer_id())
+    if not storage.update_with_stored_configuration(configuration):
+        raise ValueError(f"Nothing indexed in {storage.db.name}")
+    check_storage_version(storage.db, compact_storage)
+    # Drop the data of pending blocks, like a restarted indexer would
+    cursor = configuration.starting_cursor
+    storage.invalidate(cursor)
+    check_journal_coverage(storage.db, derived, config.STARTING_BLOCK)
+
+    scratch = IndexerStorage(mongo_url, f"{indexer.indexer_id()}-rebuild")
+    scratch.drop_database()
+    ctx = {"network": "starknet-goerli"}
+    from_address = felt.from_hex(config.GAME_CONTRACT)
+    previous = None
+    rebuilt = 0
+    started = time.perf_counter()
+    for block in read_journal(storage.db, from_address, cursor.order_key):
+        end_cursor = starknet_cursor(block.header.block_number)
+        with scratch.create_storage_for_data(end_cursor) as block_storage:
+            info = Info(
+                context=ctx,
+                storage=block_storage,
+                cursor=previous,
+                end_cursor=end_cursor,
+            )
+            await indexer.handle_data(info, block)
+        previous = end_cursor
+        rebuilt += 1
+
+    for collection in collections:
+        storage.db[collection].drop()
+        batch = []
+        for doc in scratch.db[collection].find():
+            batch.append(doc)
+            if len(batch) == batch_size:
+                storage.db[collection].insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            storage.db[collection].insert_many(batch, ordered=False)
+    ensure_indexes(storage.db)
+    scratch.drop_database()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Rebuilt %s from %s journaled blocks in %.1fs",
+        ", ".join(collections),
+        rebuilt,
+        elapsed,
+    )
+    stop_logging()
@@ -0,0 +1,96 @@
+"""MongoDB indexes of the indexer collections."""
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Apibara keeps every version of a document, live documents have no
+# `_chain.valid_to`, so all lookups are prefixed with it.
+LIVE = ("_chain.valid_to", ASCENDING)
+# Chain position of the last write, see `indexer.writer.chain_position`
+POSITION = ("position", DESCENDING)
+# The lists are sorted on a field and `_id`, so the sort indexes end with it
+ID = ("_id", DESCENDING)
+
+INDEXES = {
+    "adventurers": [
+        [LIVE, ("id", ASCENDING)],
+        [LIVE, ("owner", ASCENDING), ("timestamp", DESCENDING), ID],
+        [LIVE, ("xp", DESCENDING), ID],
+        [LIVE, ("gold", DESCENDING), ID],
+        [LIVE, ("timestamp", DESCENDING), ID],
+        [LIVE, POSITION, ID],
+    ],
+    "items": [
+        [LIVE, ("item", ASCENDING), ("adventurerId", ASCENDING), ("owner", ASCENDING)],
+        [LIVE, ("adventurerId", ASCENDING), ("owner", ASCENDING)],
+        [LIVE, ("adventurerId", ASCENDING), ("timestamp", DESCENDING), ID],
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "market_items": [
+        [LIVE, ("adventurerId", ASCENDING), ("item", ASCENDING)],
+        [("adventurerId", ASCENDING), ("generation", DESCENDING)],
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "bags": [
+        [LIVE, ("adventurerId", ASCENDING)],
+    ],
+    "beasts": [
+        [LIVE, ("beast", ASCENDING), ("adventurerId", ASCENDING), ("seed", ASCENDING)],
+        [LIVE, ("adventurerId", ASCENDING), ("timestamp", DESCENDING), ID],
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "discoveries": [
+        [
+            LIVE,
+            ("entity", ASCENDING),
+            ("adventurerId", ASCENDING),
+            ("seed", ASCENDING),
+            ("discoveryTime", DESCENDING),
+        ],
+        [LIVE, ("adventurerId", ASCENDING), ("timestamp", DESCENDING), ID],
+        [LIVE, ("txHash", ASCENDING)],
+        [LIVE, ("timestamp", DESCENDING), ID],
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "battles": [
+        [LIVE, ("adventurerId", ASCENDING), ("timestamp", DESCENDING), ID],
+        [LIVE, ("txHash", ASCENDING)],
+        [LIVE, ("timestamp", DESCENDING), ID],
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "scores": [
+        [LIVE, ("xp", DESCENDING), ID],
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "deaths": [
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "health_purchases": [
+        [LIVE, POSITION, ID],
+        [LIVE, ("adventurerId", ASCENDING), POSITION, ID],
+    ],
+    "journal": [
+        [LIVE, POSITION, ID],
+    ],
+}
+
+
+def ensure_indexes(db):
+    """Create the indexes of all collections in `db`.
+
+    Creating an index that already exists is a no-op, so this is safe to call
+    on every start.
+    """
+    created = []
+    for collection, indexes in INDEXES.items():
+        models = [IndexModel(keys) for keys in indexes]
+        # Used by apibara to roll back the data of invalidated blocks
+        models.append(IndexModel([("_chain.valid_from", ASCENDING)]))
+        created.extend(db[collection].create_indexes(models))
+    return created
@@ -0,0 +1,122 @@
+"""Journal of the raw events handled by the indexer.
+
+With `--journal`, every event of a block is also written to the `journal`
+collection, in the same bulk write as the documents its handler produced, so
+the journal always matches the indexed data and is rolled back with it. A
+journal entry keeps the event's block, transaction, index and selector, and its
+other keys and data felts as varint blobs.
+
+`indexer rebuild` replays the journal to regenerate the other collections,
+e.g. after changing how a handler shapes its documents, without streaming the
+chain again.
+"""
+
+from io import BytesIO
+
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Block, EventWithTransaction
+from pymongo import ASCENDING
+
+from indexer.archive import encode_varint, read_varint
+from indexer.writer import chain_position, event_id
+
+COLLECTION = "journal"
+
+
+def pack_felts(values):
+    return b"".join(encode_varint(felt.to_int(value)) for value in values)
+
+
+def unpack_felts(data):
+    file = BytesIO(data)
+    values = []
+    while True:
+        value = read_varint(file)
+        if value is None:
+            return values
+        values.append(felt.from_int(value))
+
+
+def journal_document(data: Block, event_with_tx: EventWithTransaction):
+    """Return the journal entry of an event of `data` and its `_id`."""
+    block_number = data.header.block_number
+    event = event_with_tx.event
+    tx_hash = felt.to_int(event_with_tx.transaction.meta.hash)
+    tx_index = event_with_tx.receipt.transaction_index
+    doc = {
+        "block": block_number,
+        "timestamp": data.header.timestamp.seconds,
+        "txHash": tx_hash.to_bytes(32, "big"),
+        "txIndex": tx_index,
+        "index": event.index,
+        "position": chain_position(block_number, tx_index, event.index),
+        "selector": felt.to_int(event.keys[0]).to_bytes(32, "big"),
+        "keys": pack_felts(event.keys[1:]),
+        "data": pack_felts(event.data),
+    }
+    return doc, event_id(block_number, tx_hash, event.index)
+
+
+def journal_event(doc, from_address):
+    """Return the event of a journal entry, emitted by `from_address`."""
+    event_with_tx = EventWithTransaction()
+    event_with_tx.transaction.meta.hash.CopyFrom(
+        felt.from_int(int.from_bytes(doc["txHash"], "big"))
+    )
+    event_with_tx.receipt.transaction_index = doc["txIndex"]
+    event = event_with_tx.event
+    event.from_address.CopyFrom(from_address)
+    event.index = doc["index"]
+    event.keys.append(felt.from_int(int.from_bytes(doc["selector"], "big")))
+    event.keys.extend(unpack_felts(doc["keys"]))
+    event.data.extend(unpack_felts(doc["data"]))
+    return event_with_tx
+
+
+def first_block(db, collection):
+    """Return the block of the oldest document of `collection`, `None` if it
+    is empty."""
+    doc = db[collection].find_one(
+        {}, {"_chain.valid_from": 1}, sort=[("_chain.valid_from", ASCENDING)]
+    )
+    return doc["_chain"]["valid_from"] if doc is not None else None
+
+
+def check_journal_coverage(db, collections, starting_block):
+    """Raise a `ValueError` if the journal of `db` doesn't start with the first
+    block indexed in `collections`, or at `starting_block` if they are empty.
+
+    A journal enabled after the first block would rebuild partial collections.
+    """
+    journal_block = first_block(db, COLLECTION)
+    if journal_block is None:
+        raise ValueError(f"The journal of {db.name} is empty")
+    indexed = [first_block(db, collection) for collection in collections]
+    indexed = [block for block in indexed if block is not None]
+    indexed_block = min(indexed) if indexed else starting_block
+    if indexed_block is not None and journal_block != indexed_block:
+        raise ValueError(
+            f"The journal of {db.name} starts at block {journal_block}, but the"
+            f" indexed data starts at block {indexed_block}"
+        )
+
+
+def read_journal(db, from_address, until_block):
+    """Yield the blocks of the live journal entries of `db` up to
+    `until_block`, with only their header number and timestamp."""
+    entries = (
+        db[COLLECTION]
+        .find({"_chain.valid_to": None, "block": {"$lte": until_block}})
+        .sort([("position", ASCENDING), ("_id", ASCENDING)])
+    )
+    block = None
+    for doc in entries:
+        if block is None or block.header.block_number != doc["block"]:
+            if block is not None:
+                yield block
+            block = Block()
+            block.header.block_number = doc["block"]
+            block.header.timestamp.seconds = doc["timestamp"]
+        block.events.append(journal_event(doc, from_address))
+    if block is not None:
+        yield block
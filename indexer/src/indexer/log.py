@@ -0,0 +1,126 @@
+"""Structured logging of the indexer.
+
+Records are put on a queue as they are and formatted as JSON lines by a
+listener thread, so the handlers don't pay for formatting and I/O. The info
+and debug records of the event handlers are sampled per event name, warnings
+and errors are always logged.
+"""
+
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+# Block and event being handled, added to the records
+current_block = ContextVar("current_block", default=None)
+current_event = ContextVar("current_event", default=None)
+
+
+class EventSampler:
+    """Decide if the records of an event are logged, given the sampling rate
+    of its name (`default` for the others)."""
+
+    def __init__(self, default=1.0, rates=None):
+        self.default = default
+        self.rates = rates or {}
+
+    def __call__(self, event):
+        rate = self.rates.get(event, self.default)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def parse_sample(values):
+    """Parse `--log-sample` values, either a default rate (`0.01`) or the rate
+    of an event (`StartGame=1`)."""
+    sampler = EventSampler()
+    for value in values:
+        event, _, rate = value.rpartition("=")
+        if event:
+            sampler.rates[event] = float(rate)
+        else:
+            sampler.default = float(rate)
+    return sampler
+
+
+class IndexerLogger(logging.LoggerAdapter):
+    sampler = EventSampler()
+
+    def __init__(self, name):
+        super().__init__(logging.getLogger(name), {})
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.isEnabledFor(level):
+            return
+        event = current_event.get()
+        if level < logging.WARNING and event is not None and not self.sampler(event):
+            return
+        super().log(level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {
+            "block": current_block.get(),
+            "event": current_event.get(),
+            **kwargs.get("extra", {}),
+        }
+        return msg, kwargs
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("block", "event"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Formatted by the listener, records don't leave the process
+        return record
+
+
+_listener = None
+
+
+def configure_logging(level="INFO", sample=()):
+    """Send the records of the indexer and apibara to stdout through a queue.
+
+    `sample` are `--log-sample` values, see `parse_sample`.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = QueueListener(records, output)
+    _listener.start()
+
+    handler = DeferredQueueHandler(records)
+    for name in ("indexer", "apibara"):
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.setLevel(level.upper())
+        logger.propagate = False
+    IndexerLogger.sampler = parse_sample(sample)
+
+
+def stop_logging():
+    """Write the queued records."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,165 @@
+"""Prometheus metrics of the indexer.
+
+Metrics are module-level objects updated by the indexer, and rendered in the
+Prometheus text format by the `/metrics` endpoint of `start_metrics_server`.
+In sharded mode, the handler and MongoDB metrics of the shard processes are not
+collected, only the time each shard takes to apply its part of a block.
+"""
+
+from bisect import bisect_left
+
+from aiohttp import web
+
+from indexer.log import IndexerLogger
+
+logger = IndexerLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+REGISTRY = []
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for _, value in pairs
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped))
+        + "}"
+    )
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, value=1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            # Count of each bucket (non cumulative), plus +Inf, sum
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = format_labels(self.labels, labels, [("le", bound)])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            series = format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{series} {total}")
+            lines.append(f"{self.name}_count{series} {cumulative}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+BLOCKS = Counter("indexer_blocks_total", "Blocks handled by the indexer.", ["status"])
+BLOCK_NUMBER = Gauge(
+    "indexer_block_number", "Number of the last handled block.", ["status"]
+)
+BLOCK_LAG = Gauge(
+    "indexer_block_lag_seconds",
+    "Time between the timestamp of the last handled block and its handling.",
+    ["status"],
+)
+BLOCK_SECONDS = Histogram(
+    "indexer_block_seconds", "Time spent handling a block.", ["status"]
+)
+EVENTS = Counter("indexer_events_total", "Events handled, by event name.", ["event"])
+DECODE_SECONDS = Histogram(
+    "indexer_decode_seconds", "Time spent decoding the events of a block."
+)
+HANDLER_SECONDS = Histogram(
+    "indexer_handler_seconds", "Time spent in the event handlers.", ["event"]
+)
+MONGO_SECONDS = Histogram(
+    "indexer_mongo_seconds",
+    "Duration of the MongoDB round trips of the indexer.",
+    ["collection", "operation"],
+)
+SHARD_SECONDS = Histogram(
+    "indexer_shard_apply_seconds",
+    "Time spent by a shard process to apply its part of a block.",
+    ["shard"],
+)
+
+
+async def metrics(_request):
+    return web.Response(text=render(), content_type="text/plain")
+
+
+async def start_metrics_server(port):
+    """Serve the metrics on `/metrics` from the running event loop."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "0.0.0.0", int(port))
+    await site.start()
+    logger.info("Metrics server started on port %s", port)
+    return runner
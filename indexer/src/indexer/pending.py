@@ -0,0 +1,109 @@
+"""Incremental processing of the pending block.
+
+Before every message following a pending block, the apibara runner invalidates
+the data of that pending block, and the new (pending or accepted) version of
+the block is applied from scratch. Near the chain head, the pending block only
+grows, so most of the events would be applied again and again.
+
+`PendingBlockStorage` defers this invalidation to the indexer, which only drops
+the pending data if the new block doesn't extend the events already applied,
+and otherwise applies the new events only.
+"""
+
+from contextlib import contextmanager
+from typing import Optional
+
+from apibara.indexer.storage import IndexerStorage
+from apibara.protocol.proto.stream_pb2 import Cursor
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Block
+from pymongo.client_session import ClientSession
+
+
+def event_keys(data: Block):
+    """Identify the events of `data` by transaction and content, in order."""
+    return [
+        (
+            felt.to_int(event_with_tx.transaction.meta.hash),
+            event_with_tx.event.SerializeToString(),
+        )
+        for event_with_tx in data.events
+    ]
+
+
+class PendingBlockStorage(IndexerStorage):
+    def __init__(self, url: Optional[str], indexer_id: str) -> None:
+        super().__init__(url, indexer_id)
+        # Events of the pending block already applied
+        self.pending_block = None
+        self.pending_block_number = None
+        self.pending_events = []
+        self._incoming = False
+        self._deferred = None
+
+    @contextmanager
+    def _defer_invalidation(self, storage):
+        # The runner invalidates the previous pending block inside these
+        # contexts, before handling the new block
+        self._incoming = True
+        try:
+            with storage as block_storage:
+                yield block_storage
+                # No block was handled, nothing depends on the pending data
+                self.invalidate_pending()
+        finally:
+            self._incoming = False
+            self._deferred = None
+
+    def create_storage_for_data(self, cursor: Cursor):
+        return self._defer_invalidation(super().create_storage_for_data(cursor))
+
+    def create_storage_for_pending(self, cursor: Cursor):
+        return self._defer_invalidation(super().create_storage_for_pending(cursor))
+
+    def invalidate(self, cursor: Cursor, session: Optional[ClientSession] = None):
+        if self._incoming and self.pending_block_number is not None:
+            self._deferred = (cursor, session)
+            return
+        self.pending_block = None
+        self.pending_block_number = None
+        self.pending_events = []
+        super().invalidate(cursor, session=session)
+
+    def invalidate_pending(self):
+        if self._deferred is not None:
+            cursor, session = self._deferred
+            self._deferred = None
+            self._incoming = False
+            self.invalidate(cursor, session=session)
+
+    def applied_events(self, data: Block):
+        """Return how many events of `data` were already applied with the
+        previous pending block, or invalidate the pending data if they don't
+        match the first events of `data`."""
+        if self.pending_block_number is None:
+            return 0
+        applied = len(self.pending_events)
+        if (
+            data.header.block_number == self.pending_block_number
+            and event_keys(data)[:applied] == self.pending_events
+        ):
+            self._deferred = None
+            return applied
+        if self._deferred is None:
+            # The runner doesn't invalidate a pending block received right
+            # after connecting
+            cursor = Cursor(order_key=self.pending_block_number - 1)
+            self._deferred = (cursor, None)
+        self.invalidate_pending()
+        return 0
+
+    def set_applied(self, data: Block, pending: bool):
+        if pending:
+            self.pending_block = data
+            self.pending_block_number = data.header.block_number
+            self.pending_events = event_keys(data)
+        else:
+            self.pending_block = None
+            self.pending_block_number = None
+            self.pending_events = []
@@ -0,0 +1,162 @@
+"""Apply the accepted blocks in parallel worker processes.
+
+All the documents written by the event handlers belong to a single adventurer,
+so the events of a block are split by adventurer id into one sub-block per
+shard. Every shard is a worker process with its own indexer, caches and MongoDB
+client, applying the sub-blocks of its adventurers in order. The block is done,
+and the runner may move the cursor, once all shards have applied it.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from apibara.indexer import Info
+from apibara.indexer.storage import Storage
+from apibara.protocol.proto.stream_pb2 import Cursor
+from apibara.starknet.proto.starknet_pb2 import Block
+from pymongo import MongoClient
+
+from indexer.decoder import decode_events
+from indexer.log import configure_logging
+from indexer.metrics import SHARD_SECONDS
+
+
+def event_adventurer_id(record):
+    state = getattr(record, "adventurer_state", None)
+    if state is None:
+        state = record.adventurer_state_with_bag["adventurer_state"]
+    return state["adventurer_id"]
+
+
+def split_block(data: Block, event_names, shards):
+    """Return the sub-block of each shard with events in `data`."""
+    records = decode_events(
+        event_names, [event_with_tx.event for event_with_tx in data.events]
+    )
+    blocks = {}
+    for event_with_tx, record in zip(data.events, records):
+        shard = event_adventurer_id(record) % shards
+        block = blocks.get(shard)
+        if block is None:
+            block = blocks[shard] = Block(header=data.header)
+        block.events.append(event_with_tx)
+    return blocks
+
+
+# State of the worker processes
+_indexer = None
+_db = None
+_loop = None
+
+
+def init_shard(config, mongo_url, db_name, log_options):
+    # Imported here, `indexer.indexer` imports this module
+    from indexer.indexer import LootSurvivorIndexer
+
+    global _indexer, _db, _loop
+    configure_logging(*log_options)
+    _indexer = LootSurvivorIndexer(config)
+    _indexer.initial_configuration()
+    _db = MongoClient(mongo_url)[db_name]
+    _loop = asyncio.new_event_loop()
+
+
+def apply_shard_block(data, cursor, end_cursor, context):
+    block = Block()
+    block.ParseFromString(data)
+    cursor = Cursor.FromString(cursor) if cursor is not None else None
+    end_cursor = Cursor.FromString(end_cursor)
+    info = Info(
+        context=context,
+        storage=Storage(_db, cursor=end_cursor),
+        cursor=cursor,
+        end_cursor=end_cursor,
+    )
+    _loop.run_until_complete(_indexer.apply_block(info, block))
+
+
+def clear_shard_caches():
+    _indexer.adventurers.clear()
+    _indexer.discovery_times.clear()
+
+
+def forget_shard_adventurers(adventurer_ids):
+    for adventurer_id in adventurer_ids:
+        _indexer.adventurers.pop(adventurer_id)
+    adventurer_ids = set(adventurer_ids)
+    _indexer.discovery_times.invalidate(lambda key: key[0] in adventurer_ids)
+
+
+class ShardPool:
+    def __init__(self, config, mongo_url, db_name, shards, log_options):
+        self.shards = shards
+        # Spawned so the workers don't inherit the MongoDB client of the runner
+        context = multiprocessing.get_context("spawn")
+        self.executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=init_shard,
+                initargs=(config, mongo_url, db_name, log_options),
+            )
+            for _ in range(shards)
+        ]
+
+    async def apply(self, info: Info, data: Block, event_names):
+        """Apply the events of `data` in the shards, and wait for all of them."""
+        loop = asyncio.get_running_loop()
+        cursor = info.cursor.SerializeToString() if info.cursor else None
+        end_cursor = info.end_cursor.SerializeToString()
+        blocks = split_block(data, event_names, self.shards)
+
+        async def apply(shard, block):
+            started = time.perf_counter()
+            await loop.run_in_executor(
+                self.executors[shard],
+                apply_shard_block,
+                block.SerializeToString(),
+                cursor,
+                end_cursor,
+                info.context,
+            )
+            SHARD_SECONDS.observe(time.perf_counter() - started, str(shard))
+
+        results = await asyncio.gather(
+            *[apply(shard, block) for shard, block in blocks.items()],
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            # The shards that succeeded are ahead of the cursor, which is not
+            # moved, so their caches must not be used anymore
+            await self.clear_caches()
+            raise errors[0]
+
+    async def clear_caches(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *[
+                loop.run_in_executor(executor, clear_shard_caches)
+                for executor in self.executors
+            ]
+        )
+
+    async def forget_adventurers(self, adventurer_ids):
+        loop = asyncio.get_running_loop()
+        shard_ids = {}
+        for adventurer_id in adventurer_ids:
+            shard_ids.setdefault(adventurer_id % self.shards, []).append(adventurer_id)
+        await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self.executors[shard], forget_shard_adventurers, ids
+                )
+                for shard, ids in shard_ids.items()
+            ]
+        )
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown()
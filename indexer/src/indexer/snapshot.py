@@ -0,0 +1,218 @@
+"""Snapshots of the indexer database.
+
+A snapshot is a directory named after its block number, holding one file of
+concatenated BSON documents per collection, zstd-compressed when `zstandard`
+is installed, and a `snapshot.json` with the cursor of the block. All the
+versions of the documents are kept, so blocks can still be invalidated after a
+restore.
+
+Snapshots are written in a background thread while the indexer goes on. The
+documents written after the snapshot block are told apart by their `_chain`,
+so the snapshot holds the database as it was at its block.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bson
+from apibara.cursor import to_json
+from apibara.protocol.proto.stream_pb2 import Cursor
+
+from indexer.archive import open_archive, zstandard
+from indexer.indexes import ensure_indexes
+from indexer.log import IndexerLogger
+
+logger = IndexerLogger(__name__)
+
+META_FILE = "snapshot.json"
+
+
+def snapshot_path(directory, block_number):
+    return os.path.join(directory, f"{block_number:010d}")
+
+
+def list_snapshots(directory):
+    """Return the paths of the complete snapshots in `directory`, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.isdigit() and os.path.exists(os.path.join(directory, name, META_FILE))
+    ]
+
+
+def document_at(doc, block_number):
+    """Return `doc` as it was at `block_number`, `None` if it didn't exist."""
+    chain = doc.get("_chain")
+    if chain is None:
+        return doc
+    if chain["valid_from"] > block_number:
+        return None
+    valid_to = chain.get("valid_to")
+    if valid_to is not None and valid_to > block_number:
+        # Replaced after the block
+        doc["_chain"] = {**chain, "valid_to": None}
+    return doc
+
+
+def write_snapshot(db, directory, cursor: Cursor, cancelled=None):
+    """Write all the collections of `db`, as they were at `cursor`, to a new
+    snapshot. Returns its path, or `None` if the `cancelled` event was set
+    while writing."""
+    block_number = cursor.order_key
+    path = snapshot_path(directory, block_number)
+    # Written aside and renamed, so only complete snapshots are listed
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    extension = ".bson.zst" if zstandard is not None else ".bson"
+
+    counts = {}
+    for collection in sorted(db.list_collection_names()):
+        file_path = os.path.join(tmp_path, collection + extension)
+        with open_archive(file_path, "wb") as file:
+            count = 0
+            for doc in db[collection].find().sort("_id", 1):
+                doc = document_at(doc, block_number)
+                if doc is not None:
+                    file.write(bson.encode(doc))
+                    count += 1
+        counts[collection] = count
+        if cancelled is not None and cancelled.is_set():
+            shutil.rmtree(tmp_path)
+            return None
+
+    with open(os.path.join(tmp_path, META_FILE), "w") as file:
+        json.dump(
+            {"cursor": to_json(cursor), "collections": counts, "extension": extension},
+            file,
+        )
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+def restore_snapshot(db, path, indexer_id, batch_size=10_000):
+    """Replace the content of `db` with the snapshot at `path`, and set the
+    indexer cursor to the one of the snapshot. Returns the cursor."""
+    with open(os.path.join(path, META_FILE)) as file:
+        meta = json.load(file)
+
+    db.client.drop_database(db.name)
+    for collection in meta["collections"]:
+        file_path = os.path.join(path, collection + meta["extension"])
+        with open_archive(file_path, "rb") as file:
+            batch = []
+            for doc in bson.decode_file_iter(file):
+                batch.append(doc)
+                if len(batch) == batch_size:
+                    db[collection].insert_many(batch, ordered=False)
+                    batch = []
+            if batch:
+                db[collection].insert_many(batch, ordered=False)
+
+    # The data of the snapshot block was written before the runner moved the
+    # stored cursor
+    db["_apibara"].update_one(
+        {"indexer_id": indexer_id}, {"$set": {"cursor": meta["cursor"]}}
+    )
+    ensure_indexes(db)
+    return meta["cursor"]
+
+
+class Snapshots:
+    """Write a snapshot every `interval` blocks, keeping the `keep` latest.
+
+    Blocks without events are not handled, so a snapshot is written at the
+    first handled block at least `interval` blocks after the previous one, and
+    only one snapshot is written at a time.
+    """
+
+    def __init__(self, directory, interval, keep=2):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        snapshots = list_snapshots(directory)
+        # Block of the latest snapshot, `None` to write one right away
+        self.last_block = int(os.path.basename(snapshots[-1])) if snapshots else None
+        # Snapshot being written: its future, cancel event and block number
+        self.writing = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        if zstandard is None:
+            logger.warning(
+                "The zstandard package is not installed, snapshots are written"
+                " uncompressed"
+            )
+
+    def maybe_write(self, db, cursor: Cursor):
+        self.collect()
+        if self.writing is not None:
+            return
+        if (
+            self.last_block is not None
+            and cursor.order_key - self.last_block < self.interval
+        ):
+            return
+        cancelled = threading.Event()
+        future = self.executor.submit(self.write, db, cursor, cancelled)
+        self.writing = (future, cancelled, cursor.order_key)
+
+    def write(self, db, cursor: Cursor, cancelled):
+        started = time.perf_counter()
+        path = write_snapshot(db, self.directory, cursor, cancelled)
+        if path is None:
+            logger.warning(
+                "Dropped the snapshot of block %s, invalidated while writing it",
+                cursor.order_key,
+            )
+            return None
+        logger.info("Wrote snapshot %s in %.1fs", path, time.perf_counter() - started)
+        for old_path in list_snapshots(self.directory)[: -self.keep]:
+            shutil.rmtree(old_path)
+        return cursor.order_key
+
+    def collect(self, wait=False):
+        """Record the snapshot being written once it is done, or wait for it."""
+        if self.writing is None:
+            return
+        future, _, block_number = self.writing
+        if not wait and not future.done():
+            return
+        self.writing = None
+        try:
+            written = future.result()
+        except Exception:
+            logger.exception("Failed to write the snapshot of block %s", block_number)
+            return
+        if written is not None:
+            self.last_block = written
+
+    def invalidate(self, cursor: Cursor):
+        """Drop the snapshot being written if its block was invalidated."""
+        if self.writing is not None and self.writing[2] > cursor.order_key:
+            self.writing[1].set()
+
+    def close(self):
+        """Wait for the snapshot being written, if any."""
+        self.collect(wait=True)
+        self.executor.shutdown()
+
+    def restore_latest(self, db, indexer_id):
+        """Restore the latest snapshot into `db`, if any."""
+        snapshots = list_snapshots(self.directory)
+        if not snapshots:
+            logger.warning("No snapshot found in %s", self.directory)
+            return None
+        started = time.perf_counter()
+        cursor = restore_snapshot(db, snapshots[-1], indexer_id)
+        logger.info(
+            "Restored snapshot %s in %.1fs",
+            snapshots[-1],
+            time.perf_counter() - started,
+        )
+        return cursor
@@ -1,6 +1,8 @@
 from datetime import datetime
 import hashlib
 
+from indexer.enums import encode_felt
+
 
 def str_to_felt(text):
     b_text = bytes(text, "ascii")
@@ -20,7 +22,7 @@ def get_key_by_value(v, dict):
 
 
 def encode_int_as_bytes(n):
-    return n.to_bytes(32, "big")
+    return encode_felt(n)
 
 
 def decode_bytes_as_int(n):
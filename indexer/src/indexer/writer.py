@@ -0,0 +1,421 @@
+"""Block-scoped write buffer for the indexer storage."""
+
+import asyncio
+import time
+from copy import deepcopy
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+from indexer.compact import compact_document, compact_filter, compact_update
+from indexer.metrics import MONGO_SECONDS
+
+Document = Dict[str, Any]
+DocumentFilter = Dict[str, Any]
+Update = Dict[str, Any]
+
+MISSING = object()
+
+
+def get_field(doc: Document, key: str):
+    value = doc
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def set_field(doc: Document, key: str, value):
+    parts = key.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def matches(doc: Document, filter: DocumentFilter) -> bool:
+    """Match `doc` against an equality-only `filter`, like Mongo would.
+
+    A `None` value matches both null and missing fields.
+    """
+    for key, expected in filter.items():
+        if isinstance(expected, dict) and any(k.startswith("$") for k in expected):
+            raise NotImplementedError(f"unsupported filter operator on {key}")
+        value = get_field(doc, key)
+        if value is MISSING:
+            if expected is not None:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def apply_update(doc: Document, update: Update):
+    for operator, fields in update.items():
+        if operator != "$set":
+            raise NotImplementedError(f"unsupported update operator {operator}")
+        for key, value in fields.items():
+            set_field(doc, key, value)
+
+
+def sort_documents(docs: List[Document], sort: Dict[str, int]) -> List[Document]:
+    # Stable sort on each key, least significant first. Nulls sort first.
+    for key, direction in reversed(list(sort.items())):
+
+        def sort_key(doc, key=key):
+            value = get_field(doc, key)
+            if value is MISSING or value is None:
+                return (0, 0)
+            return (1, value)
+
+        docs.sort(key=sort_key, reverse=direction < 0)
+    return docs
+
+
+POSITION_BITS = (("block number", 27), ("transaction index", 16), ("event index", 20))
+
+
+def chain_position(block_number: int, tx_index: int, event_index: int) -> int:
+    """Pack the position of an event in the chain in an int64: 27 bits of
+    block number, 16 of transaction index and 20 of event index."""
+    for (name, bits), value in zip(
+        POSITION_BITS, (block_number, tx_index, event_index)
+    ):
+        if not 0 <= value < 1 << bits:
+            raise ValueError(f"{name} {value} does not fit in a chain position")
+    return block_number << 36 | tx_index << 20 | event_index
+
+
+def event_id(block_number: int, tx_hash: int, event_index: int) -> bytes:
+    """Identify an event by its block, transaction hash and index."""
+    return (
+        block_number.to_bytes(8, "big")
+        + tx_hash.to_bytes(32, "big")
+        + event_index.to_bytes(4, "big")
+    )
+
+
+class BlockWriter:
+    """Buffer all the writes produced while handling one block.
+
+    Exposes the subset of apibara's `Storage` interface used by the handlers, so
+    it can be swapped in as `info.storage`. Inserts and updates are kept in memory
+    and `flush` sends them as one unordered `bulk_write` per collection.
+
+    Updates follow the same chain-aware versioning as `Storage`: the live
+    document is clamped with `_chain.valid_to` and a new version is inserted with
+    `_chain.valid_from` set to the block. Several updates to the same document
+    within a block produce a single new version. Documents already written by
+    this block, when a pending block is completed or a block is handled again,
+    are updated in place.
+
+    The handlers write through `for_event`, which gives every new document
+    (or version) a deterministic `_id` derived from the event, and sets its
+    `position` to the chain position of the last event that wrote it. Documents
+    are upserted by `_id`, so handling a block again doesn't duplicate them.
+
+    Updates are resolved lazily: the documents they target are fetched with a
+    single query per collection, either when the collection is read or when the
+    block is flushed. Reads see the buffered writes.
+
+    With `compact`, documents and filters are converted to the compact storage
+    schema on their way in.
+
+    With an `executor`, the reads run in its threads so that handlers of
+    different adventurers can wait for MongoDB concurrently. The handlers must
+    then only read and write the documents of their own adventurer while
+    another handler is running.
+    """
+
+    def __init__(
+        self, db, block_number: int, session=None, compact=False, executor=None
+    ):
+        self._db = db
+        self._block_number = block_number
+        self._session = session
+        self._compact = compact
+        self._executor = executor
+        # held while resolving the operations of a collection
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # operations not yet resolved against the live documents
+        self._log: Dict[str, List[tuple]] = {}
+        # new documents (and new versions) to insert, in insertion order
+        self._pending: Dict[str, List[Document]] = {}
+        # ids of live documents superseded in this block
+        self._clamped: Dict[str, List[Any]] = {}
+        # ids of documents written by this block before, and deleted since
+        self._removed: Dict[str, List[Any]] = {}
+
+    @property
+    def block_number(self) -> int:
+        return self._block_number
+
+    def _touch(self, collection: str):
+        if collection not in self._pending:
+            self._log[collection] = []
+            self._pending[collection] = []
+            self._clamped[collection] = []
+            self._removed[collection] = []
+            self._locks[collection] = asyncio.Lock()
+
+    def _live_filter(self, collection: str, filter: DocumentFilter) -> DocumentFilter:
+        filter = dict(filter)
+        filter["_chain.valid_to"] = None
+        taken = self._clamped.get(collection, []) + self._removed.get(collection, [])
+        if taken:
+            filter["_id"] = {"$nin": taken}
+        return filter
+
+    async def _find_live(self, collection: str, filter: DocumentFilter):
+        filter = self._live_filter(collection, filter)
+        started = time.perf_counter()
+        if self._executor is None:
+            docs = list(self._db[collection].find(filter, session=self._session))
+        else:
+            # Sessions can't be used by several threads at once
+            docs = await asyncio.get_running_loop().run_in_executor(
+                self._executor, lambda: list(self._db[collection].find(filter))
+            )
+        MONGO_SECONDS.observe(time.perf_counter() - started, collection, "find")
+        # Stored versions of the documents rewritten in this block
+        rewritten = {doc.get("_id") for doc in self._pending.get(collection, [])}
+        return [doc for doc in docs if doc["_id"] not in rewritten]
+
+    def _written(self, doc: Document) -> bool:
+        return doc.get("_chain", {}).get("valid_from") == self._block_number
+
+    def _new_document(self, doc: Document, _id=None) -> Document:
+        doc.pop("_id", None)
+        if _id is not None:
+            doc["_id"] = _id
+        doc["_chain"] = {"valid_from": self._block_number, "valid_to": None}
+        return doc
+
+    async def _resolve(self, collection: str):
+        if collection not in self._locks:
+            return
+        # Other handlers must not read the collection before the operations
+        # taken from the log are applied, even once the log is empty
+        async with self._locks[collection]:
+            log = self._log[collection]
+            self._log[collection] = []
+            if log:
+                await self._apply_log(collection, log)
+
+    async def _apply_log(self, collection: str, log: List[tuple]):
+        update_filters = [op[1] for op in log if op[0] != "insert"]
+        # When the block is handled again, the documents it inserts replace
+        # the ones it wrote before
+        inserted = {op[1]["_id"] for op in log if op[0] == "insert" and "_id" in op[1]}
+        live = []
+        if update_filters:
+            live = await self._find_live(collection, {"$or": update_filters})
+            live = [doc for doc in live if doc["_id"] not in inserted]
+
+        pending = self._pending[collection]
+        clamped = self._clamped[collection]
+        removed = self._removed[collection]
+        pending_ids = {doc.get("_id") for doc in pending} & inserted
+        for op in log:
+            if op[0] == "insert":
+                if op[1].get("_id") in pending_ids:
+                    # Written, and maybe updated in place, by an earlier read
+                    pending[:] = [
+                        doc for doc in pending if doc.get("_id") != op[1]["_id"]
+                    ]
+                pending.append(op[1])
+                continue
+            if op[0] == "delete":
+                for doc in [doc for doc in live if matches(doc, op[1])]:
+                    live.remove(doc)
+                    (removed if self._written(doc) else clamped).append(doc["_id"])
+                for doc in [doc for doc in pending if matches(doc, op[1])]:
+                    pending.remove(doc)
+                    if "_id" in doc:
+                        removed.append(doc["_id"])
+                continue
+            _, filter, update, _id = op
+            # Untouched live documents come first in natural order, followed by
+            # the documents written in this block.
+            target = next((doc for doc in live if matches(doc, filter)), None)
+            if target is not None:
+                live.remove(target)
+                if not self._written(target):
+                    clamped.append(target["_id"])
+                    target = self._new_document(target, _id)
+                pending.append(target)
+            else:
+                target = next((doc for doc in pending if matches(doc, filter)), None)
+            if target is not None:
+                apply_update(target, update)
+
+    def for_event(self, tx_hash: int, tx_index: int, event_index: int) -> "EventWriter":
+        """Return the writer of the handler of an event."""
+        position = chain_position(self._block_number, tx_index, event_index)
+        return EventWriter(
+            self, event_id(self._block_number, tx_hash, event_index), position
+        )
+
+    async def insert_one(self, collection: str, doc: Document, _id=None):
+        """Insert `doc` into `collection`."""
+        self._touch(collection)
+        if self._compact:
+            doc = compact_document(collection, doc)
+        self._log[collection].append(("insert", self._new_document(doc, _id)))
+
+    async def insert_many(self, collection: str, docs: List[Document]):
+        """Insert multiple `docs` into `collection`."""
+        for doc in docs:
+            await self.insert_one(collection, doc)
+
+    async def find_one_and_update(
+        self, collection: str, filter: DocumentFilter, update: Update, _id=None
+    ):
+        """Update the first document in `collection` matching `filter` with `update`.
+
+        Unlike `Storage.find_one_and_update`, nothing is returned since the
+        update is only resolved when the collection is next read or flushed.
+        """
+        self._touch(collection)
+        filter = {k: v for k, v in filter.items() if k != "_chain.valid_to"}
+        if self._compact:
+            filter = compact_filter(collection, filter)
+            update = compact_update(collection, update)
+        self._log[collection].append(("update", filter, update, _id))
+
+    update_one = find_one_and_update
+
+    async def delete_many(self, collection: str, filter: DocumentFilter):
+        """Delete all documents in `collection` matching `filter`, including the
+        ones written in this block."""
+        self._touch(collection)
+        filter = {k: v for k, v in filter.items() if k != "_chain.valid_to"}
+        if self._compact:
+            filter = compact_filter(collection, filter)
+        self._log[collection].append(("delete", filter))
+
+    async def find(
+        self,
+        collection: str,
+        filter: DocumentFilter,
+        sort: Optional[Dict[str, int]] = None,
+        projection=None,
+        skip: int = 0,
+        limit: int = 0,
+    ) -> Iterator[Document]:
+        """Find all live documents in `collection` matching `filter`, including
+        the ones buffered in this block."""
+        await self._resolve(collection)
+        filter = {k: v for k, v in filter.items() if k != "_chain.valid_to"}
+        if self._compact:
+            filter = compact_filter(collection, filter)
+        docs = await self._find_live(collection, filter)
+        docs.extend(
+            deepcopy(doc)
+            for doc in self._pending.get(collection, [])
+            if matches(doc, filter)
+        )
+        if sort is not None:
+            docs = sort_documents(docs, sort)
+        docs = docs[skip:]
+        if limit:
+            docs = docs[:limit]
+        return iter(docs)
+
+    async def find_one(
+        self, collection: str, filter: DocumentFilter
+    ) -> Optional[Document]:
+        """Find the first live document in `collection` matching `filter`."""
+        return next(await self.find(collection, filter, limit=1), None)
+
+    async def flush(self):
+        """Write all buffered operations, one `bulk_write` per collection."""
+        await asyncio.gather(
+            *[self._resolve(collection) for collection in self._pending]
+        )
+        for collection in list(self._pending):
+            pending = self._pending[collection]
+            requests = [
+                UpdateOne(
+                    {"_id": _id},
+                    {"$set": {"_chain.valid_to": self._block_number}},
+                )
+                for _id in self._clamped[collection]
+            ]
+            # Keep the last version of each document, so that no document is
+            # the target of two requests and they can run in any order
+            latest = {doc.get("_id", id(doc)): doc for doc in pending}
+            requests.extend(
+                DeleteOne({"_id": _id})
+                for _id in self._removed[collection]
+                if _id not in latest
+            )
+            requests.extend(
+                ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+                if "_id" in doc
+                else InsertOne(doc)
+                for doc in latest.values()
+            )
+            if requests:
+                started = time.perf_counter()
+                self._db[collection].bulk_write(
+                    requests, ordered=False, session=self._session
+                )
+                MONGO_SECONDS.observe(
+                    time.perf_counter() - started, collection, "bulk_write"
+                )
+        self._log.clear()
+        self._pending.clear()
+        self._clamped.clear()
+        self._removed.clear()
+        self._locks.clear()
+
+
+class EventWriter:
+    """Writes of the handler of one event to a `BlockWriter`.
+
+    The n-th document the handler writes to a collection, inserted or new
+    version of an updated document, gets the event id followed by n as `_id`.
+    """
+
+    def __init__(self, writer: BlockWriter, event_id: bytes, position: int):
+        self._writer = writer
+        self._event_id = event_id
+        self._position = position
+        self._counts: Dict[str, int] = {}
+
+    def _next_id(self, collection: str) -> bytes:
+        count = self._counts.get(collection, 0)
+        self._counts[collection] = count + 1
+        return self._event_id + count.to_bytes(2, "big")
+
+    @property
+    def block_number(self) -> int:
+        return self._writer.block_number
+
+    async def insert_one(self, collection: str, doc: Document):
+        doc["position"] = self._position
+        await self._writer.insert_one(collection, doc, self._next_id(collection))
+
+    async def insert_many(self, collection: str, docs: List[Document]):
+        for doc in docs:
+            await self.insert_one(collection, doc)
+
+    async def find_one_and_update(
+        self, collection: str, filter: DocumentFilter, update: Update
+    ):
+        update = {**update, "$set": {**update["$set"], "position": self._position}}
+        await self._writer.find_one_and_update(
+            collection, filter, update, self._next_id(collection)
+        )
+
+    update_one = find_one_and_update
+
+    async def delete_many(self, collection: str, filter: DocumentFilter):
+        await self._writer.delete_many(collection, filter)
+
+    async def find(self, collection: str, filter: DocumentFilter, **kwargs):
+        return await self._writer.find(collection, filter, **kwargs)
+
+    async def find_one(self, collection: str, filter: DocumentFilter):
+        return await self._writer.find_one(collection, filter)
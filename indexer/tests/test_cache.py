@@ -0,0 +1,114 @@
+import asyncio
+
+import strawberry
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from indexer.cache import LRUCache, ResponseCache
+from indexer.graphql import IndexerGraphQLView
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+
+def test_response_cache_invalidates_namespace():
+    cache = ResponseCache(1024)
+    cache.set(("goerli", "query"), b"old")
+    cache.set(("mainnet", "query"), b"kept")
+    generation = cache.generation("goerli")
+
+    cache.invalidate_namespace("goerli")
+
+    assert cache.generation("goerli") == generation + 1
+    assert cache.generation("mainnet") == 0
+    assert cache.get(("goerli", "query")) is None
+    assert cache.get(("mainnet", "query")) == b"kept"
+    assert cache.size == len(b"kept")
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    def counter(self, info) -> int:
+        info.context["calls"].append("counter")
+        return len(info.context["calls"])
+
+    @strawberry.field
+    def failing(self, info) -> int:
+        info.context["calls"].append("failing")
+        raise ValueError("failed")
+
+    @strawberry.field
+    def moving(self, info) -> int:
+        # The indexer cursor moves while the query runs
+        info.context["calls"].append("moving")
+        info.context["cache"].invalidate_namespace("test")
+        return 0
+
+
+class CountingView(IndexerGraphQLView):
+    def __init__(self, cache, calls, **kwargs):
+        super().__init__(
+            None, cache=cache, network="test", schema=strawberry.Schema(Query), **kwargs
+        )
+        self.cache = cache
+        self.calls = calls
+
+    async def get_context(self, request, response):
+        context = await super().get_context(request, response)
+        return {**context, "cache": self.cache, "calls": self.calls}
+
+
+async def request_cached(requests, **view_options):
+    cache = ResponseCache(1024)
+    calls = []
+    app = web.Application()
+    app.router.add_route("*", "/", CountingView(cache, calls, **view_options))
+    statuses = []
+    async with TestClient(TestServer(app)) as client:
+        for method, query in requests:
+            if method == "GET":
+                response = await client.get("/", params={"query": query})
+            else:
+                response = await client.post("/", json={"query": query})
+            statuses.append(response.status)
+    return statuses, calls
+
+
+def test_cached_query():
+    statuses, calls = asyncio.run(
+        request_cached([("POST", "{ counter }"), ("POST", "{  counter  }")])
+    )
+    assert statuses == [200, 200]
+    assert calls == ["counter"]
+
+
+def test_cached_query_still_validated():
+    statuses, calls = asyncio.run(
+        request_cached(
+            [("POST", "{ counter }"), ("GET", "{ counter }")],
+            allow_queries_via_get=False,
+        )
+    )
+    assert statuses == [200, 400]
+    assert calls == ["counter"]
+
+
+def test_errors_not_cached():
+    statuses, calls = asyncio.run(
+        request_cached([("POST", "{ failing }"), ("POST", "{ failing }")])
+    )
+    assert calls == ["failing", "failing"]
+
+
+def test_response_of_previous_block_not_cached():
+    statuses, calls = asyncio.run(
+        request_cached([("POST", "{ moving }"), ("POST", "{ moving }")])
+    )
+    assert calls == ["moving", "moving"]
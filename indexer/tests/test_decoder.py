@@ -0,0 +1,80 @@
+import random
+
+import pytest
+from apibara.starknet import felt
+from starknet_py.cairo.data_types import (
+    ArrayType,
+    BoolType,
+    EnumType,
+    FeltType,
+    StructType,
+    UintType,
+)
+from starknet_py.serialization import serializer_for_payload
+
+from indexer.decoder import compile_event_decoder, event_decoders, game_contract_abi
+
+EVENTS = sorted(game_contract_abi.events.values(), key=lambda event: event.name)
+SAMPLES = 50
+
+
+def sample_data(rng, cairo_type, data):
+    """Append random data of `cairo_type` to `data`."""
+    if isinstance(cairo_type, FeltType):
+        data.append(rng.getrandbits(250))
+    elif isinstance(cairo_type, UintType) and cairo_type.bits == 256:
+        data += [rng.getrandbits(128), rng.getrandbits(128)]
+    elif isinstance(cairo_type, UintType):
+        data.append(rng.getrandbits(cairo_type.bits))
+    elif isinstance(cairo_type, BoolType):
+        data.append(rng.randint(0, 1))
+    elif isinstance(cairo_type, StructType):
+        for member_type in cairo_type.types.values():
+            sample_data(rng, member_type, data)
+    elif isinstance(cairo_type, EnumType):
+        data.append(rng.randrange(len(cairo_type.variants)))
+    elif isinstance(cairo_type, ArrayType):
+        size = rng.randint(0, 5)
+        data.append(size)
+        for _ in range(size):
+            sample_data(rng, cairo_type.inner_type, data)
+    else:
+        raise TypeError(f"no sample data for {cairo_type}")
+    return data
+
+
+def samples(event):
+    rng = random.Random(event.name)
+    return [
+        [
+            value
+            for cairo_type in event.inputs.values()
+            for value in sample_data(rng, cairo_type, [])
+        ]
+        for _ in range(SAMPLES)
+    ]
+
+
+def test_every_event_has_a_decoder():
+    names = {name.split("::")[-1] for name in game_contract_abi.events}
+    assert names == set(event_decoders)
+
+
+@pytest.mark.parametrize("event", EVENTS, ids=lambda event: event.name)
+def test_decoder_matches_starknet_py(event):
+    reference = serializer_for_payload(event.inputs)
+    decoder = compile_event_decoder(event)
+    for data in samples(event):
+        expected = reference.deserialize(data).as_dict()
+        assert decoder.deserialize(data).as_dict() == expected
+        felts = [felt.from_int(value) for value in data]
+        assert decoder.deserialize_felts(felts).as_dict() == expected
+
+
+@pytest.mark.parametrize("event", EVENTS, ids=lambda event: event.name)
+def test_deserialize_many_matches_deserialize_felts(event):
+    decoder = compile_event_decoder(event)
+    rows = [[felt.from_int(value) for value in data] for data in samples(event)]
+    expected = [decoder.deserialize_felts(row).as_dict() for row in rows]
+    assert [record.as_dict() for record in decoder.deserialize_many(rows)] == expected
+    assert decoder.deserialize_many([]) == []
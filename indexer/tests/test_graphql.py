@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from indexer.graphql import decode_cursor, encode_cursor, get_keyset_filter
+
+OPERATORS = {
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+}
+
+
+def matches_condition(value, condition):
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$ne":
+            matched = value != operand
+        elif op == "$not":
+            matched = not matches_condition(value, operand)
+        elif value is None or operand is None:
+            # Mongo only compares values of the same type
+            matched = False
+        else:
+            matched = OPERATORS[op](value, operand)
+        if not matched:
+            return False
+    return True
+
+
+def matches(doc, filter):
+    """Match `doc` against the subset of the Mongo query language used by the
+    keyset filters, missing fields are null."""
+    for key, condition in filter.items():
+        if key == "$or":
+            matched = any(matches(doc, f) for f in condition)
+        elif key == "$and":
+            matched = all(matches(doc, f) for f in condition)
+        else:
+            matched = matches_condition(doc.get(key), condition)
+        if not matched:
+            return False
+    return True
+
+
+def sort_documents(docs, sort_dir):
+    # Nulls first, then ties broken on `_id`, all in `sort_dir`
+    def sort_key(doc):
+        value = doc.get("position")
+        return (value is not None, value or 0, doc["_id"])
+
+    return sorted(docs, key=sort_key, reverse=sort_dir == -1)
+
+
+def sample_documents():
+    rng = random.Random(0)
+    values = [None, None, None, 0, 1, 1, 1, 2, 5, 5, 8, 8, 8, 8, 13]
+    ids = rng.sample(range(1000), len(values))
+    docs = [{"_id": id, "position": value} for id, value in zip(ids, values)]
+    # Missing fields sort like nulls
+    del docs[0]["position"]
+    return docs
+
+
+@pytest.mark.parametrize("sort_dir", [1, -1])
+def test_keyset_filter_pages(sort_dir):
+    docs = sort_documents(sample_documents(), sort_dir)
+    for index, doc in enumerate(docs):
+        filter = get_keyset_filter(
+            "position", sort_dir, doc.get("position"), doc["_id"]
+        )
+        after = sort_documents([d for d in docs if matches(d, filter)], sort_dir)
+        assert after == docs[index + 1 :]
+
+
+@pytest.mark.parametrize("sort_dir", [1, -1])
+def test_keyset_filter_ties(sort_dir):
+    docs = [{"_id": id, "position": 7} for id in range(5)]
+    docs = sort_documents(docs, sort_dir)
+    filter = get_keyset_filter("position", sort_dir, 7, docs[1]["_id"])
+    assert [d for d in docs if matches(d, filter)] == docs[2:]
+
+
+@pytest.mark.parametrize("sort_dir", [1, -1])
+def test_keyset_filter_nulls(sort_dir):
+    docs = sort_documents(
+        [{"_id": 1}, {"_id": 2, "position": None}, {"_id": 3, "position": 4}],
+        sort_dir,
+    )
+    # Nulls come first, and last in descending order
+    assert [d["_id"] for d in docs] == ([1, 2, 3] if sort_dir == 1 else [3, 2, 1])
+    filter = get_keyset_filter("position", sort_dir, None, docs[1]["_id"])
+    assert [d for d in docs if matches(d, filter)] == docs[2:]
+    filter = get_keyset_filter("position", sort_dir, 4, 3)
+    expected = [] if sort_dir == 1 else docs[1:]
+    assert [d for d in docs if matches(d, filter)] == expected
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"_id": 3, "position": 12}, "position")
+    assert decode_cursor(cursor) == (12, 3)
+    assert decode_cursor(encode_cursor({"_id": 4}, "position")) == (None, 4)
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
@@ -0,0 +1,89 @@
+import os
+import uuid
+
+import pytest
+from pymongo import DESCENDING, MongoClient
+
+from indexer.graphql import get_keyset_filter
+from indexer.indexes import ID, INDEXES, POSITION, ensure_indexes
+
+# The explain tests need a MongoDB server, e.g. the one of `docker-compose up`
+MONGO_URL = os.environ.get("INDEXER_TEST_MONGO_URL")
+
+
+def test_position_indexes_end_with_id():
+    for collection, indexes in INDEXES.items():
+        for keys in indexes:
+            if POSITION in keys:
+                assert keys[-2:] == [POSITION, ID], (collection, keys)
+
+
+def plan_stages(plan):
+    """Yield the stages of an explain plan, whatever the query engine."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+@pytest.fixture
+def db():
+    if MONGO_URL is None:
+        pytest.skip("INDEXER_TEST_MONGO_URL is not set")
+    client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=2_000)
+    name = f"indexer_test_{uuid.uuid4().hex}"
+    db = client[name]
+    ensure_indexes(db)
+    db["items"].insert_many(
+        {
+            "_id": block,
+            "_chain": {"valid_from": block, "valid_to": None},
+            "adventurerId": block % 3,
+            "position": block // 4,
+        }
+        for block in range(100)
+    )
+    yield db
+    client.drop_database(name)
+    client.close()
+
+
+@pytest.mark.parametrize("sort_dir", [DESCENDING, -DESCENDING])
+def test_position_sort_uses_index(db, sort_dir):
+    cursor = (
+        db["items"]
+        .find({"_chain.valid_to": None})
+        .sort([("position", sort_dir), ("_id", sort_dir)])
+        .limit(10)
+    )
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    assert "SORT" not in set(plan_stages(plan))
+
+
+def test_adventurer_position_sort_uses_index(db):
+    cursor = (
+        db["items"]
+        .find({"_chain.valid_to": None, "adventurerId": 1})
+        .sort([("position", -1), ("_id", -1)])
+        .limit(10)
+    )
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    assert "SORT" not in set(plan_stages(plan))
+
+
+def test_keyset_page_seeks_index(db):
+    filter = {
+        "$and": [
+            {"_chain.valid_to": None},
+            get_keyset_filter("position", -1, 5, 22),
+        ]
+    }
+    cursor = db["items"].find(filter).sort([("position", -1), ("_id", -1)]).limit(5)
+    explain = cursor.explain()
+    assert "SORT" not in set(plan_stages(explain["queryPlanner"]["winningPlan"]))
+    # The scan starts at the cursor instead of the first document
+    assert explain["executionStats"]["totalKeysExamined"] < 20
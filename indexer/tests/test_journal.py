@@ -0,0 +1,123 @@
+import pytest
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Block, EventWithTransaction
+
+from indexer.journal import (
+    check_journal_coverage,
+    journal_document,
+    pack_felts,
+    read_journal,
+    unpack_felts,
+)
+
+GAME = felt.from_int(0x1234)
+BIG = 2**251 + 17
+
+
+class FakeCursor(list):
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            super().sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+
+class FakeCollection(list):
+    """The subset of a pymongo collection used by the journal."""
+
+    def find(self, filter):
+        def matches(doc):
+            return (
+                doc["_chain"]["valid_to"] == filter["_chain.valid_to"]
+                and doc["block"] <= filter["block"]["$lte"]
+            )
+
+        return FakeCursor(doc for doc in self if matches(doc))
+
+    def find_one(self, filter, projection, sort):
+        docs = sorted(self, key=lambda doc: doc["_chain"]["valid_from"])
+        return docs[0] if docs else None
+
+
+class FakeDatabase(dict):
+    name = "indexer"
+
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+def event(tx_hash, tx_index, index, keys, data):
+    event_with_tx = EventWithTransaction()
+    event_with_tx.transaction.meta.hash.CopyFrom(felt.from_int(tx_hash))
+    event_with_tx.receipt.transaction_index = tx_index
+    event_with_tx.event.from_address.CopyFrom(GAME)
+    event_with_tx.event.index = index
+    event_with_tx.event.keys.extend(felt.from_int(key) for key in keys)
+    event_with_tx.event.data.extend(felt.from_int(value) for value in data)
+    return event_with_tx
+
+
+def block(block_number, *events):
+    data = Block()
+    data.header.block_number = block_number
+    data.header.timestamp.seconds = 1_700_000_000 + block_number
+    data.events.extend(events)
+    return data
+
+
+def journal(*blocks):
+    db = FakeDatabase()
+    for data in blocks:
+        for event_with_tx in data.events:
+            doc, _id = journal_document(data, event_with_tx)
+            doc["_id"] = _id
+            doc["_chain"] = {"valid_from": data.header.block_number, "valid_to": None}
+            db["journal"].append(doc)
+    return db
+
+
+def test_pack_felts():
+    values = [0, 1, 127, 128, 2**64, BIG]
+    packed = pack_felts(felt.from_int(value) for value in values)
+    assert [felt.to_int(value) for value in unpack_felts(packed)] == values
+    assert unpack_felts(b"") == []
+
+
+def test_journal_round_trip():
+    blocks = [
+        block(
+            5,
+            event(0xAB, 0, 0, [0x99, 1], [0, BIG, 3]),
+            event(0xAB, 0, 1, [0x98], []),
+            event(0xCD, 2, 0, [0x99, 2**128], [2**64]),
+        ),
+        block(7, event(BIG, 1, 3, [0x97], [1, 2])),
+    ]
+    db = journal(*blocks)
+    # Stored out of order, read in chain order
+    db["journal"].reverse()
+    read = list(read_journal(db, GAME, 7))
+    assert [data.header for data in read] == [data.header for data in blocks]
+    assert [list(data.events) for data in read] == [
+        list(data.events) for data in blocks
+    ]
+    assert [data.header.block_number for data in read_journal(db, GAME, 6)] == [5]
+
+
+def test_journal_coverage():
+    db = journal(block(5, event(1, 0, 0, [0x99], [])))
+    db["items"].append({"_chain": {"valid_from": 5, "valid_to": None}})
+    check_journal_coverage(db, ["items", "beasts"], 1)
+    # Collections indexed before the journal was enabled
+    db["beasts"].append({"_chain": {"valid_from": 3, "valid_to": 4}})
+    with pytest.raises(ValueError):
+        check_journal_coverage(db, ["items", "beasts"], 1)
+
+
+def test_journal_coverage_without_indexed_data():
+    db = journal(block(5, event(1, 0, 0, [0x99], [])))
+    check_journal_coverage(db, ["items"], 5)
+    with pytest.raises(ValueError):
+        check_journal_coverage(db, ["items"], 2)
+    with pytest.raises(ValueError):
+        check_journal_coverage(FakeDatabase(), ["items"], 5)
@@ -0,0 +1,140 @@
+from contextlib import nullcontext
+
+import pytest
+from apibara.indexer.storage import IndexerStorage
+from apibara.protocol.proto.stream_pb2 import Cursor
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Block, EventWithTransaction
+
+from indexer.pending import PendingBlockStorage
+
+BLOCK = 10
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Pending block storage without MongoDB, recording the invalidations that
+    reach apibara."""
+    invalidated = []
+    monkeypatch.setattr(IndexerStorage, "__init__", lambda self, url, id: None)
+    monkeypatch.setattr(
+        IndexerStorage,
+        "invalidate",
+        lambda self, cursor, session=None: invalidated.append(cursor.order_key),
+    )
+    for name in ("create_storage_for_data", "create_storage_for_pending"):
+        monkeypatch.setattr(IndexerStorage, name, lambda self, cursor: nullcontext())
+    storage = PendingBlockStorage(None, "test")
+    storage.invalidated = invalidated
+    return storage
+
+
+def event(tx_hash, value):
+    event_with_tx = EventWithTransaction()
+    event_with_tx.transaction.meta.hash.CopyFrom(felt.from_int(tx_hash))
+    event_with_tx.event.data.append(felt.from_int(value))
+    return event_with_tx
+
+
+def block(*events, block_number=BLOCK):
+    data = Block()
+    data.header.block_number = block_number
+    data.events.extend(events)
+    return data
+
+
+class Runner:
+    """Drive the storage like the apibara runner: the data of a pending block
+    is invalidated before handling the message that follows it."""
+
+    def __init__(self, storage, cursor=BLOCK - 1):
+        self.storage = storage
+        self.cursor = Cursor(order_key=cursor)
+        self.after_pending = False
+
+    def receive(self, data, pending, handle=True):
+        """Handle `data`, returns how many of its events were already applied."""
+        end_cursor = Cursor(order_key=data.header.block_number)
+        if pending:
+            create = self.storage.create_storage_for_pending
+        else:
+            create = self.storage.create_storage_for_data
+        applied = None
+        with create(end_cursor):
+            if self.after_pending:
+                self.storage.invalidate(self.cursor)
+            if handle:
+                applied = self.storage.applied_events(data)
+                self.storage.set_applied(data, pending)
+        self.after_pending = pending
+        if not pending:
+            self.cursor = end_cursor
+        return applied
+
+
+E1, E2, E3 = event(1, 1), event(1, 2), event(2, 3)
+
+
+def test_growing_pending_block(storage):
+    runner = Runner(storage)
+    assert runner.receive(block(E1), pending=True) == 0
+    assert runner.receive(block(E1, E2), pending=True) == 1
+    assert runner.receive(block(E1, E2, E3), pending=True) == 2
+    assert storage.invalidated == []
+    assert storage.pending_block_number == BLOCK
+
+
+def test_pending_block_with_other_prefix(storage):
+    runner = Runner(storage)
+    assert runner.receive(block(E1, E2), pending=True) == 0
+    assert runner.receive(block(E2, E3), pending=True) == 0
+    assert storage.invalidated == [BLOCK - 1]
+    # The new pending block is the one applied now
+    assert runner.receive(block(E2, E3, E1), pending=True) == 2
+    assert storage.invalidated == [BLOCK - 1]
+
+
+def test_pending_block_then_accepted(storage):
+    runner = Runner(storage)
+    assert runner.receive(block(E1, E2), pending=True) == 0
+    assert runner.receive(block(E1, E2), pending=False) == 2
+    assert storage.invalidated == []
+    assert storage.pending_block is None
+    assert storage.pending_events == []
+    # The next pending block starts from scratch
+    assert runner.receive(block(E3, block_number=BLOCK + 1), pending=True) == 0
+    assert storage.invalidated == []
+
+
+def test_accepted_block_without_pending_events(storage):
+    runner = Runner(storage)
+    assert runner.receive(block(E1), pending=True) == 0
+    assert runner.receive(block(E2, E3), pending=False) == 0
+    assert storage.invalidated == [BLOCK - 1]
+    assert storage.pending_block is None
+
+
+def test_pending_block_after_reconnect(storage):
+    Runner(storage).receive(block(E1, E2), pending=True)
+    # A new connection resumes from the accepted cursor, the runner doesn't
+    # invalidate the pending data of the previous connection
+    runner = Runner(storage)
+    assert runner.receive(block(E2), pending=True) == 0
+    assert storage.invalidated == [BLOCK - 1]
+    assert storage.pending_events == [(1, E2.event.SerializeToString())]
+
+
+def test_extended_pending_block_after_reconnect(storage):
+    Runner(storage).receive(block(E1), pending=True)
+    runner = Runner(storage)
+    assert runner.receive(block(E1, E2), pending=True) == 1
+    assert storage.invalidated == []
+
+
+def test_message_not_handled(storage):
+    runner = Runner(storage)
+    runner.receive(block(E1), pending=True)
+    # Nothing handled the message, the deferred invalidation still happens
+    runner.receive(block(E1), pending=True, handle=False)
+    assert storage.invalidated == [BLOCK - 1]
+    assert storage.pending_block_number is None
@@ -0,0 +1,144 @@
+import copy
+import threading
+
+from apibara.cursor import to_json
+from apibara.protocol.proto.stream_pb2 import Cursor
+
+from indexer.snapshot import (
+    Snapshots,
+    list_snapshots,
+    restore_snapshot,
+    write_snapshot,
+)
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda doc: doc[key]))
+
+
+class FakeCollection(list):
+    def find(self):
+        return FakeCursor(copy.deepcopy(doc) for doc in self)
+
+    def insert_many(self, docs, ordered=True):
+        self.extend(copy.deepcopy(docs))
+
+    def update_one(self, filter, update):
+        for doc in self:
+            if all(doc.get(key) == value for key, value in filter.items()):
+                doc.update(update["$set"])
+                return
+
+    def create_indexes(self, models):
+        return []
+
+
+class FakeClient:
+    def __init__(self):
+        self.databases = {}
+
+    def drop_database(self, name):
+        self.databases[name].clear()
+
+
+class FakeDatabase(dict):
+    def __init__(self, client, name):
+        super().__init__()
+        self.client = client
+        self.name = name
+        client.databases[name] = self
+
+    def __missing__(self, collection):
+        self[collection] = FakeCollection()
+        return self[collection]
+
+    def list_collection_names(self):
+        return list(self)
+
+
+def chain(valid_from, valid_to=None):
+    return {"valid_from": valid_from, "valid_to": valid_to}
+
+
+def indexed_database():
+    db = FakeDatabase(FakeClient(), "indexer")
+    db["_apibara"].append(
+        {"_id": 0, "indexer_id": "indexer", "cursor": {"order_key": 12}}
+    )
+    db["items"].extend(
+        [
+            {"_id": 1, "xp": 1, "_chain": chain(3, 5)},
+            {"_id": 2, "xp": 2, "_chain": chain(5, 11)},
+            {"_id": 3, "xp": 3, "_chain": chain(11)},
+            {"_id": 4, "xp": 9, "_chain": chain(7)},
+            {"_id": 5, "xp": 4, "_chain": chain(12)},
+        ]
+    )
+    return db
+
+
+def test_snapshot_round_trip(tmp_path):
+    db = indexed_database()
+    cursor = Cursor(order_key=10, unique_key=b"\x01")
+    path = write_snapshot(db, str(tmp_path), cursor)
+    assert list_snapshots(str(tmp_path)) == [path]
+
+    restored = FakeDatabase(FakeClient(), "indexer")
+    restored["junk"].append({"_id": 1})
+    assert restore_snapshot(restored, path, "indexer") == to_json(cursor)
+    assert "junk" not in restored
+    # The documents written after the block are left out, and the ones
+    # replaced after it are live again
+    assert restored["items"] == [
+        {"_id": 1, "xp": 1, "_chain": chain(3, 5)},
+        {"_id": 2, "xp": 2, "_chain": chain(5)},
+        {"_id": 4, "xp": 9, "_chain": chain(7)},
+    ]
+    assert restored["_apibara"] == [
+        {"_id": 0, "indexer_id": "indexer", "cursor": to_json(cursor)}
+    ]
+
+
+def test_cancelled_snapshot(tmp_path):
+    cancelled = threading.Event()
+    cancelled.set()
+    cursor = Cursor(order_key=10)
+    assert write_snapshot(indexed_database(), str(tmp_path), cursor, cancelled) is None
+    assert list_snapshots(str(tmp_path)) == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_snapshots_interval(tmp_path):
+    db = indexed_database()
+    snapshots = Snapshots(str(tmp_path), interval=5)
+    for block_number in range(10, 22):
+        snapshots.maybe_write(db, Cursor(order_key=block_number))
+        snapshots.collect(wait=True)
+    snapshots.close()
+    names = [path.name for path in sorted(tmp_path.iterdir())]
+    assert names == ["0000000015", "0000000020"]
+    assert snapshots.last_block == 20
+    assert Snapshots(str(tmp_path), interval=5).last_block == 20
+
+
+def test_invalidated_snapshot_is_dropped(tmp_path):
+    db = indexed_database()
+    snapshots = Snapshots(str(tmp_path), interval=5)
+    started = threading.Event()
+    resume = threading.Event()
+    find = db["items"].find
+
+    def slow_find():
+        started.set()
+        resume.wait()
+        return find()
+
+    db["items"].find = slow_find
+    snapshots.maybe_write(db, Cursor(order_key=10))
+    started.wait()
+    snapshots.invalidate(Cursor(order_key=8))
+    resume.set()
+    snapshots.close()
+    assert list_snapshots(str(tmp_path)) == []
+    assert snapshots.last_block is None
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+import pytest
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+from indexer.writer import BlockWriter, chain_position, matches
+
+
+class FakeCollection:
+    """The subset of a pymongo collection used by `BlockWriter`."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def _matches(self, doc, filter):
+        for key, expected in filter.items():
+            if key == "$or":
+                if not any(self._matches(doc, option) for option in expected):
+                    return False
+            elif isinstance(expected, dict) and "$nin" in expected:
+                if doc.get(key) in expected["$nin"]:
+                    return False
+            elif not matches(doc, {key: expected}):
+                return False
+        return True
+
+    def find(self, filter, session=None):
+        return [
+            deepcopy(doc) for doc in self.docs.values() if self._matches(doc, filter)
+        ]
+
+    def bulk_write(self, requests, ordered=True, session=None):
+        targets = [
+            request._filter["_id"]
+            for request in requests
+            if not isinstance(request, InsertOne)
+        ]
+        assert len(targets) == len(set(targets)), "a document is targeted twice"
+        # Unordered, apply the requests in reverse to catch order dependencies
+        for request in reversed(requests):
+            if isinstance(request, UpdateOne):
+                doc = self.docs[request._filter["_id"]]
+                doc["_chain"]["valid_to"] = request._doc["$set"]["_chain.valid_to"]
+            elif isinstance(request, DeleteOne):
+                self.docs.pop(request._filter["_id"], None)
+            elif isinstance(request, ReplaceOne):
+                self.docs[request._filter["_id"]] = deepcopy(request._doc)
+            else:
+                self.docs[len(self.docs)] = deepcopy(request._doc)
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+async def handle_block(db, block_number):
+    writer = BlockWriter(db, block_number)
+    start = writer.for_event(1, 0, 0)
+    await start.insert_one("items", {"item": 1, "adventurerId": 1, "xp": 0})
+    upgrade = writer.for_event(2, 1, 0)
+    await upgrade.update_one(
+        "items", {"item": 1, "adventurerId": 1}, {"$set": {"xp": 9}}
+    )
+    # A read resolves the buffered operations before the next update
+    await upgrade.find_one("items", {"item": 1, "adventurerId": 1})
+    await writer.for_event(3, 2, 0).update_one(
+        "items", {"item": 1, "adventurerId": 1}, {"$set": {"xp": 10}}
+    )
+    await writer.flush()
+
+
+async def update_block(db, block_number):
+    writer = BlockWriter(db, block_number)
+    await writer.for_event(4, 0, 0).update_one(
+        "items", {"item": 1, "adventurerId": 1}, {"$set": {"xp": 20}}
+    )
+    await writer.flush()
+
+
+def test_block_handled_twice():
+    once = FakeDatabase()
+    asyncio.run(handle_block(once, 5))
+    asyncio.run(update_block(once, 6))
+
+    twice = FakeDatabase()
+    asyncio.run(handle_block(twice, 5))
+    asyncio.run(handle_block(twice, 5))
+    asyncio.run(update_block(twice, 6))
+    asyncio.run(update_block(twice, 6))
+
+    assert twice["items"].docs == once["items"].docs
+    live = [
+        doc for doc in once["items"].docs.values() if doc["_chain"]["valid_to"] is None
+    ]
+    assert [doc["xp"] for doc in live] == [20]
+    assert len(once["items"].docs) == 2
+
+
+class BlockingCollection(FakeCollection):
+    """Collection whose first `find` waits for `resume`."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.resume = threading.Event()
+
+    def find(self, filter, session=None):
+        if not self.started.is_set():
+            self.started.set()
+            self.resume.wait()
+        return super().find(filter, session)
+
+
+async def read_concurrently(db):
+    loop = asyncio.get_running_loop()
+    items = db["items"]
+    writer = BlockWriter(db, 5, executor=ThreadPoolExecutor(2))
+    await writer.for_event(1, 0, 0).update_one(
+        "items", {"item": 1, "adventurerId": 1}, {"$set": {"xp": 9}}
+    )
+    # The first read applies the update, and waits for MongoDB meanwhile
+    first = asyncio.ensure_future(writer.find_one("items", {"item": 1}))
+    await loop.run_in_executor(None, items.started.wait)
+    second = asyncio.ensure_future(
+        writer.find_one("items", {"item": 1, "adventurerId": 1})
+    )
+    await asyncio.sleep(0.01)
+    items.resume.set()
+    return await asyncio.gather(first, second)
+
+
+def test_read_while_resolving():
+    db = FakeDatabase()
+    db["items"] = BlockingCollection()
+    db["items"].docs["stored"] = {
+        "_id": "stored",
+        "item": 1,
+        "adventurerId": 1,
+        "xp": 0,
+        "_chain": {"valid_from": 4, "valid_to": None},
+    }
+    first, second = asyncio.run(read_concurrently(db))
+    assert first["xp"] == 9
+    assert second["xp"] == 9
+
+
+def test_chain_position_order():
+    positions = [
+        chain_position(5, 0, 1),
+        chain_position(5, 1, 0),
+        chain_position(6, 0, 0),
+        chain_position(2**27 - 1, 2**16 - 1, 2**20 - 1),
+    ]
+    assert positions == sorted(positions)
+    assert positions[-1] < 2**63
+
+
+@pytest.mark.parametrize(
+    "block_number,tx_index,event_index",
+    [(2**27, 0, 0), (1, 2**16, 0), (1, 0, 2**20), (-1, 0, 0)],
+)
+def test_chain_position_out_of_range(block_number, tx_index, event_index):
+    with pytest.raises(ValueError):
+        chain_position(block_number, tx_index, event_index)
@@ -158,7 +158,7 @@ const getDiscoveries = gql`
     discoveries(
       where: { adventurerId: { eq: $adventurerId } }
       limit: 1000000
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...DiscoveryFields
     }
@@ -171,7 +171,7 @@ const getLatestDiscoveries = gql`
     discoveries(
       where: { adventurerId: { eq: $adventurerId } }
       limit: 10
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...DiscoveryFields
     }
@@ -184,7 +184,7 @@ const getLastDiscovery = gql`
     discoveries(
       where: { adventurerId: { eq: $adventurerId } }
       limit: 1
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...DiscoveryFields
     }
@@ -197,7 +197,7 @@ const getLastBeastDiscovery = gql`
     discoveries(
       where: { adventurerId: { eq: $adventurerId }, entity: { gt: 0 } }
       limit: 1
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...DiscoveryFields
     }
@@ -322,7 +322,7 @@ const getLatestBattlesByAdventurer = gql`
   query get_latest_battles($adventurerId: FeltValue) {
     battles(
       limit: 10
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
       where: { adventurerId: { eq: $adventurerId } }
     ) {
       ...BattleFields
@@ -335,7 +335,7 @@ const getBattlesByAdventurer = gql`
   query get_battles($adventurerId: FeltValue) {
     battles(
       limit: 1000000
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
       where: { adventurerId: { eq: $adventurerId } }
     ) {
       ...BattleFields
@@ -356,7 +356,7 @@ const getBattlesByBeast = gql`
         beast: { eq: $beast }
         seed: { eq: $seed }
       }
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...BattleFields
     }
@@ -369,7 +369,7 @@ const getLastBattleByAdventurer = gql`
     battles(
       limit: 1
       where: { adventurerId: { eq: $adventurerId } }
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...BattleFields
     }
@@ -381,7 +381,7 @@ const getBattleByTxHash = gql`
   query get_latest_battle_by_tx($txHash: HexValue) {
     battles(
       where: { txHash: { eq: $txHash } }
-      orderBy: { timestamp: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...BattleFields
     }
@@ -400,10 +400,10 @@ const getItemsByTokenId = gql`
 const getLatestMarketItems = gql`
   ${ITEMS_FRAGMENT}
   query get_latest_market_items($adventurerId: FeltValue, $limit: Int) {
-    items(
+    items: marketItems(
       where: { adventurerId: { eq: $adventurerId } }
       limit: $limit
-      orderBy: { createdTime: { desc: true } }
+      orderBy: { position: { desc: true } }
     ) {
       ...ItemFields
     }